@@ -1,20 +1,17 @@
-import requests
 from bs4 import BeautifulSoup
-from cred_store import fetch_credentials
 import itchdb  # Import the itchdb module
-from game_page_info import fetch_additional_game_info 
+import itchhttp
+from game_page_info import parse_number, fetch_additional_game_info, clear_game_info_memo
 import itchylog as log 
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-headers = fetch_credentials()
-
-def fetch_html(url, headers):
-    response = requests.get(url, headers=headers)
+def fetch_html(url, headers=None):
+    response = itchhttp.get_cached(url, headers=headers)
     if response.status_code == 200:
         response.encoding = 'utf-8'  # Explicitly setting encoding to 'utf-8'
         return BeautifulSoup(response.text, 'html.parser')
     else:
-        log.error(f"Failed to retrieve the page {url}. Status code: {response.status_code}")
+        log.error("Failed to retrieve the page %s. Status code: %s", url, response.status_code)
         return None
 
 def extract_bundles(soup):
@@ -49,7 +46,7 @@ def extract_game_info(soup):
         dl_page = game.select_one('.game_title a')['href']  # Extracting game link
         img_url = game.select_one('.game_thumb').get('data-background_image', 'No image available')
 
-        file_count = game.select_one('.file_count').text.split()[0] if game.select_one('.file_count') else 'No files'
+        file_count = parse_number(game.select_one('.file_count').text, int, 0) if game.select_one('.file_count') else 0
         description = game.select_one('.game_short_text').text.strip() if game.select_one('.game_short_text') else 'No description'
 
         platforms = []
@@ -106,19 +103,19 @@ def extract_game_info(soup):
             'Platforms': ', '.join(platforms),
             'Description': description,
             'Download': download_url,
-            'Stars': additional_game_info.get('Stars', ''),
-            'RatingCount': additional_game_info.get('RatingCount', ''),
+            'Stars': additional_game_info.get('Stars'),
+            'RatingCount': additional_game_info.get('RatingCount'),
             'Author': additional_game_info.get('Author', ''),
             'Genre': additional_game_info.get('Genre', ''),
             'AverageSession': additional_game_info.get('AverageSession', ''),
             'Languages': additional_game_info.get('Languages', ''),
-            'Updated': additional_game_info.get('Updated', ''),
-            'Published': additional_game_info.get('Published', ''),
+            'Updated': additional_game_info.get('Updated'),
+            'Published': additional_game_info.get('Published'),
             'Status': additional_game_info.get('Status', ''),
             'Inputs': additional_game_info.get('Inputs', ''),
             'Accessibility': additional_game_info.get('Accessibility', ''),
             'Tags': additional_game_info.get('Tags', ''),
-            'ReleaseDate': additional_game_info.get('ReleaseDate', ''),  # Added ReleaseDate field
+            'ReleaseDate': additional_game_info.get('ReleaseDate'),  # Added ReleaseDate field
             'Other': ', '.join(additional_game_info.get('Other', [])) if isinstance(additional_game_info.get('Other', []), list) else additional_game_info.get('Other', '')
         }
 
@@ -128,33 +125,35 @@ def find_next_page(soup):
     next_page_link = soup.select_one('.next_page')
     return next_page_link['href'] if next_page_link else None
 
-def process_bundle(bundle):
-    log.info(f"Fetching games from bundle: {bundle['name']}")
+def process_bundle(bundle, writer):
+    log.info("Fetching games from bundle: %s", bundle['name'])
     current_page_url = bundle['url']
     bundle_games_count = 0
     total_games = 0
 
     while current_page_url:
-        log.info(f"Fetching data from: {current_page_url}")
-        soup = fetch_html(current_page_url, headers)
+        log.info("Fetching data from: %s", current_page_url)
+        soup = fetch_html(current_page_url)
         if soup:
             games = extract_game_info(soup)
             bundle_games_count += len(games)
             total_games += len(games)
             for title, game in games.items():
                 print(f"Inserting[{total_games}]: '{title}' into DATABASSe!!")
-                itchdb.insert_game(game)  # Insert game data into the database
+                writer.put(game, bundle)  # Queue game data for the database writer
             next_page_path = find_next_page(soup)
             current_page_url = f"{bundle['url']}{next_page_path}" if next_page_path else None
         else:
             log.error("Failed to fetch the page.")
             break
 
-    log.info(f"Total games in bundle '{bundle['name']}': {bundle_games_count}")
+    log.info("Total games in bundle '%s': %s", bundle['name'], bundle_games_count)
     return total_games
 
 def main():
     log.info("Starting main process...")
+    # Every game page is fetched at most once per crawl
+    clear_game_info_memo()
     # Ensure the database and table are created if they don't exist
     if not itchdb.db_file_exists():
         log.info("Scratching up a database...")
@@ -165,42 +164,46 @@ def main():
 
     # Counting the number of rows in the Game table
     row_count = itchdb.count_rows()
-    log.info(f"Total number of rows in the Game table: {row_count}")
+    log.info("Total number of rows in the Game table: %s", row_count)
     
     # Exit the main function if the row count is more than 0
     if row_count > 0:
         log.info("Trying a test query for a title...")
         game = itchdb.get_game_by_title('A Short Hike')
-        log.info(f"Game retrieved: {game}")
-        log.info(f"DB Already exists and has {row_count} rows (>0 rows).")
+        log.info("Game retrieved: %s", game)
+        log.info("DB Already exists and has %s rows (>0 rows).", row_count)
         return
     else:
         log.info("Creating the database and table...")
         itchdb.create_db()
     
     bundles_page_url = 'https://itch.io/my-purchases/bundles'
-    bundles_soup = fetch_html(bundles_page_url, headers)
+    bundles_soup = fetch_html(bundles_page_url)
 
     if bundles_soup:
         bundles = extract_bundles(bundles_soup)
-        log.info(f"Found {len(bundles)} bundles:")
+        log.info("Found %s bundles:", len(bundles))
         for bundle in bundles:
-            log.info(f"Name: {bundle['name']}, URL: {bundle['url']}, Time: {bundle['time']}")
+            log.info("Name: %s, URL: %s, Time: %s", bundle['name'], bundle['url'], bundle['time'])
 
         total_games = 0
 
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            future_to_bundle = {executor.submit(process_bundle, bundle): bundle for bundle in bundles}
+        # Worker threads only queue rows, the writer owns the database connection
+        with itchdb.GameWriter() as writer, ThreadPoolExecutor(max_workers=5) as executor:
+            future_to_bundle = {executor.submit(process_bundle, bundle, writer): bundle for bundle in bundles}
             for future in as_completed(future_to_bundle):
                 bundle = future_to_bundle[future]
                 try:
                     bundle_games_count = future.result()
                     total_games += bundle_games_count
                 except Exception as exc:
-                    log.error(f"Bundle {bundle['name']} generated an exception: {exc}")
+                    log.error("Bundle %s generated an exception: %s", bundle['name'], exc)
 
-        log.info(f"Total games processed from all bundles: {total_games}")
-        log.info(f"Total games in the database: {itchdb.count_rows()}")
+        if writer.failed:
+            log.warning("The database writer lost %d rows", writer.failed)
+            print(f"{writer.failed} games could not be written to the database, run it again to retry them.")
+        log.info("Total games processed from all bundles: %s", total_games)
+        log.info("Total games in the database: %s", itchdb.count_rows())
         print(f"Total games processed from all bundles: {total_games}")
         print(f"Total games in the database: {itchdb.count_rows()}")
 
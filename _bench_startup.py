@@ -0,0 +1,53 @@
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+# Import time budget in milliseconds of each command line entry point, and the libraries it must not load on import
+BUDGETS = {
+    '_query': (60, ['requests', 'bs4', 'cryptography', 'logging']),
+    '_scratch': (80, ['requests', 'bs4', 'cryptography', 'logging']),
+    '_setup': (80, ['requests', 'bs4', 'cryptography', 'logging']),
+    'usage': (20, ['requests', 'bs4', 'cryptography', 'logging', 'sqlite3']),
+}
+HEAVY_MODULES = ['requests', 'bs4', 'cryptography', 'urllib3', 'logging', 'sqlite3']
+
+def measure(module, runs=5):
+    """
+    Cold import time of module in milliseconds, the best of `runs` fresh interpreters as reported by
+    -X importtime, and the heavy modules the import pulled in.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    code = f"import sys; sys.path.insert(0, {here!r}); import {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    best = None
+    loaded = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, cwd=here)
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+        cumulative = [int(match.group(1)) for match in re.finditer(rf"^import time:\s+\d+ \|\s+(\d+) \| {re.escape(module)}$", result.stderr, re.M)]
+        elapsed = cumulative[-1] / 1000 if cumulative else 0
+        best = elapsed if best is None else min(best, elapsed)
+        loaded = [name for name in result.stdout.strip().split(',') if name]
+    return best, loaded
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the command line tools start fast and load no heavy libraries on import.")
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters per module, the fastest one counts.")
+    parser.add_argument('--scale', type=float, default=1.0, help="Multiply every budget, e.g. 2 on a slow machine.")
+    args = parser.parse_args()
+
+    failures = 0
+    for module, (budget, forbidden) in BUDGETS.items():
+        elapsed, loaded = measure(module, args.runs)
+        budget *= args.scale
+        unexpected = [name for name in loaded if name in forbidden]
+        ok = elapsed <= budget and not unexpected
+        failures += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {module:<10} {elapsed:7.1f} ms (budget {budget:.0f} ms)"
+              + (f", loaded {', '.join(unexpected)}" if unexpected else ""))
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
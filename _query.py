@@ -1,5 +1,10 @@
 import sqlite3
 import argparse
+import csv
+import json
+import sys
+import itchdb
+from itchdb import FACETS, title_trigrams
 import itchylog as log
 
 def get_game_by_title(title, db_file='itch.db'):
@@ -7,12 +12,12 @@ def get_game_by_title(title, db_file='itch.db'):
     Retrieves game information by title from the database, ignoring case.
     """
     
-    log.info(f"Querying the database for the game titled '{title}'.")
-    conn = sqlite3.connect(db_file)
+    log.info("Querying the database for the game titled '%s'.", title)
+    conn = itchdb.get_connection(db_file)
     cursor = conn.cursor()
     try:
-        # Use LOWER() to make the search case-insensitive
-        cursor.execute("SELECT * FROM Game WHERE LOWER(Title) = LOWER(?)", (title,))
+        # COLLATE NOCASE makes the search case-insensitive and uses the Title index
+        cursor.execute("SELECT * FROM Game WHERE Title = ? COLLATE NOCASE", (title,))
         game = cursor.fetchone()
         if game:
             keys = ['id', 'Title', 'Developer', 'ImageURL', 'HomePage', 'Key', 'DLPage', 'FileCount', 'Platforms', 'Description', 'Download',
@@ -25,77 +30,231 @@ def get_game_by_title(title, db_file='itch.db'):
             log.warning("Game not found in the database.")
             return None
     except sqlite3.Error as e:
-        log.error(f"Database error: {e}")
+        log.error("Database error: %s", e)
         return None
-    finally:
-        conn.close()
+
+
+def find_similar_titles(title, limit=5, db_file='itch.db'):
+    """
+    Returns up to `limit` (id, Title, similarity) of the titles closest to the given one.
+    Candidates sharing the most trigrams come from the trigram index, then they are ranked by trigram Jaccard similarity.
+    """
+    log.info("Looking for titles similar to '%s'.", title)
+    trigrams = title_trigrams(title)
+    if not trigrams:
+        return []
+    conn = itchdb.get_connection(db_file)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f'''SELECT g.id, g.Title FROM GameTitleTrigram t JOIN Game g ON g.id = t.GameId
+                           WHERE t.Trigram IN ({', '.join('?' for _ in trigrams)})
+                           GROUP BY t.GameId ORDER BY COUNT(*) DESC LIMIT ?''', list(trigrams) + [limit * 10])
+        candidates = []
+        for game_id, candidate in cursor.fetchall():
+            candidate_trigrams = title_trigrams(candidate)
+            similarity = len(trigrams & candidate_trigrams) / len(trigrams | candidate_trigrams)
+            candidates.append((game_id, candidate, similarity))
+        candidates.sort(key=lambda candidate: candidate[2], reverse=True)
+        return candidates[:limit]
+    except sqlite3.Error as e:
+        log.error("Database error: %s", e)
+        return []
 
 
 def get_games_by_genre(genre, db_file='itch.db'):
     """
     Searches for all games in the database that include a specified genre.
     """
-    log.info(f"Searching for games with genre containing '{genre}'.")
-    conn = sqlite3.connect(db_file)
+    log.info("Searching for games with genre containing '%s'.", genre)
+    conn = itchdb.get_connection(db_file)
     cursor = conn.cursor()
     try:
-        cursor.execute('''SELECT * FROM Game WHERE Genre LIKE ?''', (f"%{genre}%",))
+        # The substring match runs over the distinct genre names, the games are then found through the index
+        cursor.execute('''SELECT * FROM Game WHERE id IN (
+                            SELECT gg.GameId FROM GameGenre gg JOIN Genre g ON g.id = gg.GenreId WHERE g.Name LIKE ?)''',
+                       (f"%{genre}%",))
         games = cursor.fetchall()
         if games:
-            log.info(f"Found {len(games)} games with genre containing '{genre}'.")
+            log.info("Found %s games with genre containing '%s'.", len(games), genre)
             return games
         else:
             log.warning("No games found with the specified genre.")
             return []
     except sqlite3.Error as e:
-        log.error(f"Database error: {e}")
+        log.error("Database error: %s", e)
+        return []
+
+
+def search_games(terms, limit=20, db_file='itch.db'):
+    """
+    Full-text search over titles, developers, descriptions, tags and genres, best matches first.
+    Returns (id, Title, Developer, snippet) rows.
+    """
+    log.info("Searching the full-text index for '%s'.", terms)
+    # Title matches weigh most, then developer, tags and genre, then the description
+    sql = '''SELECT g.id, g.Title, g.Developer, snippet(GameSearch, -1, '[', ']', '...', 12)
+             FROM GameSearch JOIN Game g ON g.id = GameSearch.rowid
+             WHERE GameSearch MATCH ?
+             ORDER BY bm25(GameSearch, 10.0, 5.0, 1.0, 3.0, 3.0)
+             LIMIT ?'''
+    conn = itchdb.get_connection(db_file)
+    cursor = conn.cursor()
+    try:
+        try:
+            cursor.execute(sql, (terms, limit))
+        except sqlite3.OperationalError:
+            # Plain words with punctuation (e.g. 'sci-fi') aren't valid FTS5 syntax, so search them as quoted phrases
+            quoted = ' '.join('"' + term.replace('"', '""') + '"' for term in terms.split())
+            cursor.execute(sql, (quoted, limit))
+        results = cursor.fetchall()
+        log.info("Found %s games matching '%s'.", len(results), terms)
+        return results
+    except sqlite3.Error as e:
+        log.error("Database error: %s", e)
+        return []
+
+
+def parse_facet_filter(value):
+    """Parse a 'facet:name' filter such as 'genre:RPG' or 'platform:Linux' into (facet table, name)."""
+    facet, _, name = value.partition(':')
+    facets = {facet_table.lower(): facet_table for facet_table in FACETS.values()}
+    if facet.lower() not in facets or not name:
+        raise argparse.ArgumentTypeError(f"expected FACET:NAME with FACET one of {', '.join(facets)}, got '{value}'")
+    return facets[facet.lower()], name
+
+def get_games_by_facets(include, exclude=(), db_file='itch.db'):
+    """
+    Finds the games linked to every (facet, name) in include and to none in exclude, e.g.
+    genre AND platform AND NOT tag. Each filter is a range of its link table's primary key,
+    and the ranges are combined with INTERSECT and EXCEPT before any Game row is read.
+    """
+    log.info("Searching for games with %s and without %s.", include, exclude)
+    subquery = 'SELECT GameId FROM Game{facet} WHERE {facet}Id = (SELECT id FROM {facet} WHERE Name = ?)'
+    compound = ' INTERSECT '.join(subquery.format(facet=facet) for facet, _ in include) or 'SELECT id FROM Game'
+    for facet, _ in exclude:
+        compound += ' EXCEPT ' + subquery.format(facet=facet)
+    params = [name for _, name in include] + [name for _, name in exclude]
+
+    conn = itchdb.get_connection(db_file)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT * FROM Game WHERE id IN ({compound})", params)
+        games = cursor.fetchall()
+        log.info("Found %s games matching the filters.", len(games))
+        return games
+    except sqlite3.Error as e:
+        log.error("Database error: %s", e)
         return []
-    finally:
-        conn.close()
 
 
 def execute_custom_sql(sql_query, db_file='itch.db'):
-    log.info(f"Executing custom SQL query: {sql_query}")
-    conn = sqlite3.connect(db_file)
+    log.info("Executing custom SQL query: %s", sql_query)
+    conn = itchdb.get_connection(db_file)
     cursor = conn.cursor()
     try:
         cursor.execute(sql_query)
         results = cursor.fetchall()
+        # Custom SQL is never committed, the connection is shared with the other queries
+        if conn.in_transaction:
+            conn.rollback()
         if results:
             log.info("Custom SQL query executed successfully. Results found.")
             return results
         else:
             log.warning("No results found for the custom SQL query.")
-            log.warning(f"Executed SQL: {sql_query}")  # For debugging
+            log.warning("Executed SQL: %s", sql_query)  # For debugging
             return []
     except sqlite3.Error as e:
-        log.error(f"Database error during custom SQL execution: {e}")
+        log.error("Database error during custom SQL execution: %s", e)
         return []
-    finally:
-        conn.close()
 
         
 
+def stream_custom_sql(sql_query, db_file='itch.db', limit=None, offset=None, batch_size=1000):
+    """
+    Runs a custom SQL query and returns its column names and a generator of row batches,
+    fetched `batch_size` rows at a time so large results are never held in memory.
+    `limit` and `offset` page through the results.
+    """
+    params = ()
+    if limit is not None or offset is not None:
+        sql_query = f"SELECT * FROM ({sql_query.strip().rstrip(';')}) LIMIT ? OFFSET ?"
+        params = (limit if limit is not None else -1, offset or 0)
+    log.info("Streaming custom SQL query: %s %s", sql_query, params)
+    conn = itchdb.get_connection(db_file)
+    cursor = conn.cursor()
+    cursor.execute(sql_query, params)
+    columns = [column[0] for column in cursor.description or []]
+    return columns, fetch_batches(conn, cursor, batch_size)
+
+def fetch_batches(conn, cursor, batch_size):
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        # Custom SQL is never committed, the connection is shared with the other queries
+        if conn.in_transaction:
+            conn.rollback()
+
+def export_custom_sql(sql_query, output_format, out=None, limit=None, offset=None, db_file='itch.db'):
+    """Writes the results of a custom SQL query as csv, tsv or jsonl to `out` (stdout by default). Returns the row count."""
+    columns, batches = stream_custom_sql(sql_query, db_file, limit, offset)
+    output = open(out, 'w', newline='', encoding='utf-8') if out else sys.stdout
+    row_count = 0
+    try:
+        if output_format == 'jsonl':
+            for rows in batches:
+                output.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows)
+                row_count += len(rows)
+        else:
+            writer = csv.writer(output, delimiter='\t' if output_format == 'tsv' else ',', lineterminator='\n')
+            writer.writerow(columns)
+            for rows in batches:
+                writer.writerows(rows)
+                row_count += len(rows)
+    finally:
+        if out:
+            output.close()
+    log.info("Exported %s rows as %s to %s.", row_count, output_format, out or 'stdout')
+    return row_count
+
+def output_format_for(out):
+    """Guess the export format from the --out file extension, csv by default."""
+    extension = out.rsplit('.', 1)[-1].lower() if out and '.' in out else ''
+    return extension if extension in ('csv', 'tsv', 'jsonl') else 'csv'
+
 def count_rows(db_file='itch.db', table_name='Game'):
     """
     Counts the number of rows in the specified table.
     """
-    log.info(f"Counting rows in the table '{table_name}'.")
-    conn = sqlite3.connect(db_file)
+    log.info("Counting rows in the table '%s'.", table_name)
+    conn = itchdb.get_connection(db_file)
     cursor = conn.cursor()
     cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
     count = cursor.fetchone()[0]
-    conn.close()
-    log.info(f"Total rows in '{table_name}': {count}")
+    log.info("Total rows in '%s': %s", table_name, count)
     return count
 
 def main():
     parser = argparse.ArgumentParser(description="Query the itch.io game database using various parameters. See docstring for examples.")
     parser.add_argument('--title', help="Query game by title.")
     parser.add_argument('--genre', help="Query games by genre containing the specified substring.")
+    parser.add_argument('--search', help="Full-text search over titles, developers, descriptions, tags and genres.")
+    parser.add_argument('--limit', type=int, help="Maximum number of results (defaults to 20 for --search).")
+    parser.add_argument('--offset', type=int, help="Skip this many results of --sql, to page through them with --limit.")
+    parser.add_argument('--with', dest='include', action='append', type=parse_facet_filter, default=[], metavar='FACET:NAME',
+                        help="Query games linked to a tag, genre, platform, input or language, e.g. genre:RPG. Can be repeated.")
+    parser.add_argument('--without', dest='exclude', action='append', type=parse_facet_filter, default=[], metavar='FACET:NAME',
+                        help="Leave out games linked to a tag, genre, platform, input or language, e.g. tag:Horror. Can be repeated.")
     parser.add_argument('--sql', help="Execute a custom SQL query.")
+    parser.add_argument('--format', choices=['csv', 'tsv', 'jsonl'], help="Write --sql results as csv, tsv or jsonl with column headers.")
+    parser.add_argument('--out', help="Write --sql results to this file instead of the terminal.")
     parser.add_argument('--rows', action='store_true', help="Count the number of rows in the Game table.")
     args = parser.parse_args()
+    itchdb.upgrade_db()
 
     if args.title:
         game = get_game_by_title(args.title)
@@ -105,6 +264,11 @@ def main():
                 print(f"{key}: {value}")
         else:
             print("Game not found.")
+            similar_titles = find_similar_titles(args.title)
+            if similar_titles:
+                print("Did you mean:")
+                for _, title, _ in similar_titles:
+                    print(f"  {title}")
     elif args.genre:
         games = get_games_by_genre(args.genre)
         if games:
@@ -113,13 +277,45 @@ def main():
                 print(game)
         else:
             print("No games found with the specified genre.")
-    elif args.sql:
-        results = execute_custom_sql(args.sql)
+    elif args.search:
+        results = search_games(args.search, args.limit or 20)
         if results:
-            print("Results from custom SQL query:")
-            for result in results:
-                print(result)
+            print(f"Found {len(results)} games matching '{args.search}':")
+            for game_id, title, developer, snippet in results:
+                print(f"{title} by {developer} (id {game_id})")
+                print(f"    {snippet}")
+        else:
+            print("No games found matching the search.")
+    elif args.include or args.exclude:
+        games = get_games_by_facets(args.include, args.exclude)
+        if games:
+            print(f"Found {len(games)} games matching the filters:")
+            for game in games:
+                print(game)
         else:
+            print("No games found matching the filters.")
+    elif args.sql and (args.format or args.out):
+        try:
+            row_count = export_custom_sql(args.sql, args.format or output_format_for(args.out), args.out, args.limit, args.offset)
+            if args.out:
+                print(f"Wrote {row_count} rows to {args.out}")
+        except sqlite3.Error as e:
+            log.error("Database error during custom SQL export: %s", e)
+            print(f"Database error: {e}")
+    elif args.sql:
+        try:
+            _, batches = stream_custom_sql(args.sql, limit=args.limit, offset=args.offset)
+            row_count = 0
+            for rows in batches:
+                if not row_count:
+                    print("Results from custom SQL query:")
+                for result in rows:
+                    print(result)
+                row_count += len(rows)
+            if not row_count:
+                print("No results found for the custom SQL query.")
+        except sqlite3.Error as e:
+            log.error("Database error during custom SQL execution: %s", e)
             print("No results found for the custom SQL query.")
     elif args.rows:
         row_count = count_rows()
@@ -1,21 +1,67 @@
 import argparse
 import webbrowser
-import subprocess
-from _query import get_game_by_title
-from get_downloads import main as download_main
+from _query import get_game_by_title, find_similar_titles, get_games_by_facets, get_games_by_genre, search_games, execute_custom_sql, parse_facet_filter
+from usage import print_usage
+import itchdb
+
+def pick_similar_title(title):
+    """Offer the closest titles when there is no exact match, and return the game the user picks."""
+    similar_titles = find_similar_titles(title)
+    if not similar_titles:
+        return None
+    print(f"No game titled '{title}'. Did you mean:")
+    for index, (_, similar_title, _) in enumerate(similar_titles, start=1):
+        print(f"{index}. {similar_title}")
+    choice = input("Enter the number of the game, or press Enter to cancel: ").strip()
+    if choice.isdigit() and 1 <= int(choice) <= len(similar_titles):
+        return get_game_by_title(similar_titles[int(choice) - 1][1])
+    return None
+
+def batch_download(args):
+    """Queue every game matching the filters and download the queue without prompting."""
+    import itchqueue
+    games = []
+    if args.include or args.exclude:
+        games += get_games_by_facets(args.include or [], args.exclude or [])
+    if args.genre:
+        games += get_games_by_genre(args.genre)
+    if args.search:
+        games += search_games(args.search, limit=-1)
+    if args.sql:
+        games += execute_custom_sql(args.sql)
+    if games:
+        print(f"Queued {itchqueue.enqueue(games, args.dir, args.priority)} games.")
+    itchqueue.run_queue(workers=args.workers, buffer_size=args.buffer_mib * 1024 * 1024)
 
 def query_and_download():
     parser = argparse.ArgumentParser(description="Query and download games from itch.io.")
     parser.add_argument('--title', help="The title of the game to query.")
     parser.add_argument('--dir', required=True, help="The directory where files will be downloaded.")
+    parser.add_argument('--batch', action='store_true', help="Queue every game matching the filters below and download them without prompting.")
+    parser.add_argument('--with', dest='include', action='append', type=parse_facet_filter, metavar='FACET:NAME', help="With --batch, only games with this genre, tag, platform, input or language.")
+    parser.add_argument('--without', dest='exclude', action='append', type=parse_facet_filter, metavar='FACET:NAME', help="With --batch, leave out games with this facet.")
+    parser.add_argument('--genre', help="With --batch, queue games whose genre contains this text.")
+    parser.add_argument('--search', help="With --batch, queue games matching this full-text search.")
+    parser.add_argument('--sql', help="With --batch, queue the games returned by a query, its first column being the game id.")
+    parser.add_argument('--priority', type=int, default=0, help="With --batch, higher priorities are downloaded first.")
+    parser.add_argument('--workers', type=int, default=2, help="With --batch, number of games downloaded at once.")
+    parser.add_argument('--buffer-mib', type=int, default=1, help="Size in MiB of the buffer each download stream is read into.")
     args = parser.parse_args()
+    itchdb.upgrade_db()
 
-    if args.title:
+    if args.batch:
+        batch_download(args)
+    elif args.title:
         game = get_game_by_title(args.title)
+        if not game:
+            game = pick_similar_title(args.title)
         if not game:
             print("Game not found.")
             return
 
+        # Databases crawled before unclaimed rows were updated may keep a claimed page only in a bundle row
+        _, game['DLPage'], game['Key'] = itchdb.get_download_page(game['id'])
+
         print("Game found:")
         for key, value in game.items():
             print(f"{key}: {value}")
@@ -38,17 +84,19 @@ def query_and_download():
                 print("Invalid option selected. Exiting.")
             return
 
+        # The HTTP stack is only loaded once there is something to download
+        from get_downloads import main as download_main
+
         # Ask user if they want to download all files or select a specific one
         user_choice = input("Do you want to download all files or select a specific one? (a(all) or s(select): ").strip().lower()
         if user_choice in ['a', 'all']:
-            download_main(game['DLPage'], args.dir, game.get('Key'), True, None)
+            download_main(game['DLPage'], args.dir, game.get('Key'), True, None, game_id=game['id'], buffer_size=args.buffer_mib * 1024 * 1024)
         elif user_choice in ['s', 'select']:
-            download_main(game['DLPage'], args.dir, game.get('Key'), False, None)
+            download_main(game['DLPage'], args.dir, game.get('Key'), False, None, game_id=game['id'], buffer_size=args.buffer_mib * 1024 * 1024)
         else:
             print("Invalid option provided.")
     else:
-        subprocess.run(['python', 'usage.py'])
+        print_usage()
 
 if __name__ == "__main__":
     query_and_download()
-    # subprocess.run(['python', 'usage.py'])
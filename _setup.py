@@ -2,9 +2,10 @@ import os
 import glob
 import sys
 import argparse
-import subprocess
 import itchylog as log
-import sqlite3
+import itchdb
+import itchapp
+from usage import print_usage
 
 cred_file_path = 'itch.cred'
 
@@ -31,56 +32,54 @@ def ask_user(options):
         return ask_user(options)
 
 def count_rows(db_file='itch.db', table_name='Game'):
-    conn = sqlite3.connect(db_file)
+    conn = itchdb.get_connection(db_file)
     cursor = conn.cursor()
     cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
     count = cursor.fetchone()[0]
-    conn.close()
     return count
 
 def is_database_initialized(db_file='itch.db', table_name='Game'):
-    conn = sqlite3.connect(db_file)
+    conn = itchdb.get_connection(db_file)
     cursor = conn.cursor()
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
     table_exists = cursor.fetchone() is not None
-    conn.close()
     if table_exists:
-        log.info(f"Just pinging table '{table_name}'...")
+        log.info("Just pinging table '%s'...", table_name)
         return count_rows(db_file, table_name) >= 0
     return False
 
 def run_database_initialization(db_file='itch.db', table_name='Game', init=False):
-    args = ['python', 'itchdb.py', '--db', db_file, '--table', table_name]
-    if init:
-        args.append('--init')
-    subprocess.run(args, check=True)
+    itchapp.init_database(db_file, table_name, reset=init)
     return is_database_initialized(db_file, table_name)
 
 def run_insert_bundles():
-    subprocess.run(['python', 'my-bundles.py'], check=True)
+    itchapp.crawl_library(use_async=True)
+
+def run_sync_bundles(refresh=False):
+    itchapp.sync_library(refresh=refresh)
 
 def validate_directory(directory):
     if not os.path.isdir(directory):
-        log.error(f"The directory '{directory}' does not exist.")
+        log.error("The directory '%s' does not exist.", directory)
         print(f"Error: The directory '{directory}' does not exist.")
         sys.exit(1)
     
 def run_login_script(username, password):
-    # Build the command with necessary arguments
-    args = ['python', 'login.py', '--username', username, '--password', password]
-    subprocess.run(args, check=True)
+    if not itchapp.log_in(username, password):
+        print("Login failed, check your username and password.")
+        sys.exit(1)
     
 def cred_exists():
     if os.path.exists(cred_file_path):
-        log.info(f"Credentials -> {cred_file_path}")
+        log.info("Credentials -> %s", cred_file_path)
     else:
         log.warning("Credential file does not exist")
 
 
 def main():
     parser = argparse.ArgumentParser(description='Process some usernames and passwords.')
-    parser.add_argument('--username', required=True, help='Your username')
-    parser.add_argument('--password', required=True, help='Your password')
+    parser.add_argument('--username', help='Your username, only needed when the stored session is missing or about to expire')
+    parser.add_argument('--password', help='Your password, only needed when the stored session is missing or about to expire')
     args = parser.parse_args()
 
     db_available, cred_available = check_files()
@@ -103,18 +102,31 @@ def main():
             sys.exit(0)
     else:
         log.info("Both database and credentials files are available.")
-        # run_login_script(args.username, args.password, os.getcwd())  # Assuming the current directory needs authentication
+        if count_rows() > 0 and not itchdb.crawl_complete():
+            print("The last library crawl was interrupted, resuming it only fetches what is missing.")
+            if input("Resume it now? (y/n): ").lower() == 'y':
+                run_login_script(args.username, args.password)
+                cred_exists()
+                run_insert_bundles()
+                log.info("Database is populated.")
 
-        options = ["Check game info", "Reinitialize the CLI (warns it may take a few minutes)", "Exit"]
+        options = ["Check game info", "Sync new purchases", "Sync new purchases and refresh updated games (re-checks every game page, slow on large libraries)", "Reinitialize the CLI (warns it may take a few minutes)", "Exit"]
         choice = ask_user(options)
 
         if choice == 1:
-            subprocess.run(['python', 'usage.py'])
-        elif choice == 2:
+            itchapp.report()
+            print_usage()
+        elif choice in (2, 3):
+            run_login_script(args.username, args.password)
+            cred_exists()
+            run_sync_bundles(refresh=choice == 3)
+            log.info("Database is synced.")
+        elif choice == 4:
             print("Warning: Reinitializing may take a few minutes.")
             if input("Are you sure you want to continue? (y/n): ").lower() == 'y':
                 if run_database_initialization(init=True):
                     log.info("Database re-initialization complete.")
+                    run_login_script(args.username, args.password)
                     cred_exists()
                     run_insert_bundles()
                     log.info("Database is populated.")
@@ -122,7 +134,7 @@ def main():
                     log.error("Database re-initialization failed or no data was inserted.")
             else:
                 print("Operation cancelled.")
-        elif choice == 3:
+        elif choice == 5:
             print("Exiting.")
             sys.exit(0)
 
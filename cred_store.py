@@ -1,52 +1,129 @@
 import os
 import json
-from cryptography.fernet import Fernet
+import time
 import argparse
 import itchylog as log
 
 key = b'ZmDfcTF7_60GrrY167zsiPd67pEvs0aGOv2oasOM1Pg='
-cipher_suite = Fernet(key)
+cipher_suite = None
 cred_file_path = 'itch.cred'
-
-def store_credentials(cookies):
+# Cookies that carry the itch.io login, the session lasts as long as the first of them
+AUTH_COOKIES = ('itchio_token', 'itchio')
+# A stored session this close to its expiry is treated as expired, so a long crawl doesn't lose it midway
+REFRESH_MARGIN_SECONDS = 24 * 60 * 60
+
+def get_cipher():
+    """cryptography is only imported when credentials are actually stored or read."""
+    global cipher_suite
+    if cipher_suite is None:
+        from cryptography.fernet import Fernet
+        cipher_suite = Fernet(key)
+    return cipher_suite
+
+def cookie_entries(cookies):
+    """Serializable cookie list from a cookie jar, or from a {name: value} dict of itch.io cookies."""
+    if isinstance(cookies, dict):
+        return [{'name': name, 'value': value, 'domain': '.itch.io', 'path': '/', 'expires': None, 'secure': True}
+                for name, value in cookies.items()]
+    return [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path,
+             'expires': cookie.expires, 'secure': cookie.secure} for cookie in cookies]
+
+def session_expiry(cookies):
+    """Earliest expiry (Unix time) of the auth cookies in a cookie list, or None if none of them expires."""
+    expiries = [cookie['expires'] for cookie in cookies if cookie['name'] in AUTH_COOKIES and cookie['expires']]
+    return min(expiries) if expiries else None
+
+def store_credentials(cookies, expires=None):
+    """
+    Encrypt the request headers and the whole cookie jar with the session expiry into itch.cred.
+    `cookies` is a cookie jar, or a {name: value} dict whose expiry is unknown.
+    """
     log.info("Cookies received for storage")
-    log.debug(f"Cookies: {cookies}")
 
+    entries = cookie_entries(cookies)
     data_to_store = {
-        "Accept": "*/*",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Accept-Language": "en-GB,en-US;q=0.9,en;q=0.8",
-        "Cache-Control": "no-cache",
-        "Cookie": f"itchio_token={cookies.get('itchio_token', '')}; itchio={cookies.get('itchio', '')}",
-        "User-Agent": "Mozilla/5.0 (Linux; Android 6.0; Nexus 5 Build/MRA58N) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Mobile Safari/537.36"
+        "headers": {
+            "Accept": "*/*",
+            "Accept-Encoding": "gzip, deflate, br",
+            "Accept-Language": "en-GB,en-US;q=0.9,en;q=0.8",
+            "Cache-Control": "no-cache",
+            "User-Agent": "Mozilla/5.0 (Linux; Android 6.0; Nexus 5 Build/MRA58N) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Mobile Safari/537.36"
+        },
+        "cookies": entries,
+        "expires": expires or session_expiry(entries),
+        "stored_at": time.time()
     }
 
-    log.info("Data to be stored")
-    log.debug(f"Data: {data_to_store}")
+    log.debug("Data: %s", data_to_store)
 
     data_json = json.dumps(data_to_store)
-    encrypted_data = cipher_suite.encrypt(data_json.encode())
+    encrypted_data = get_cipher().encrypt(data_json.encode())
 
     with open(cred_file_path, 'wb') as cred_file:
         cred_file.write(encrypted_data)
 
-    log.info("Tokens have been successfully stored in itch.cred")
+    log.info("%s cookies have been successfully stored in itch.cred", len(entries))
 
-def fetch_credentials():
+def read_store():
+    """
+    Decrypted contents of itch.cred as {headers, cookies, expires}, or None without a credential file.
+    Files written before the cookie jar was stored hold only the headers, with the cookies in a Cookie header.
+    """
     if not os.path.exists(cred_file_path):
-        log.error("Credential file not found")
         return None
 
     with open(cred_file_path, 'rb') as cred_file:
         encrypted_data = cred_file.read()
 
-    decrypted_data = cipher_suite.decrypt(encrypted_data)
-    data_to_store = json.loads(decrypted_data.decode())
+    decrypted_data = get_cipher().decrypt(encrypted_data)
+    stored = json.loads(decrypted_data.decode())
+    if 'headers' not in stored:
+        stored = {'headers': stored, 'cookies': [], 'expires': None}
 
-    log.info("Decrypted data fetched")
-    log.debug(f"Decrypted data: {data_to_store}")
+    log.debug("Decrypted data: %s", stored)
+    return stored
 
-    return data_to_store
+def fetch_credentials():
+    """Headers to send with every request, or None without a credential file."""
+    stored = read_store()
+    if stored is None:
+        log.error("Credential file not found")
+        return None
+    log.info("Decrypted data fetched")
+    return stored['headers']
+
+def fetch_cookie_jar():
+    """The stored cookies as a requests cookie jar, empty without a credential file."""
+    from requests.cookies import RequestsCookieJar, create_cookie
+    jar = RequestsCookieJar()
+    stored = read_store()
+    for entry in (stored or {}).get('cookies', []):
+        jar.set_cookie(create_cookie(entry['name'], entry['value'], domain=entry['domain'], path=entry['path'],
+                                     expires=entry['expires'], secure=entry['secure']))
+    return jar
+
+def session_status(margin=REFRESH_MARGIN_SECONDS):
+    """
+    Check the stored session without any request: 'missing', 'expired' (or expiring within `margin`),
+    'valid', or 'unknown' for credentials stored without an expiry.
+    """
+    stored = read_store()
+    if stored is None:
+        return 'missing'
+    if stored['cookies']:
+        logged_in = {entry['name'] for entry in stored['cookies']}.issuperset(AUTH_COOKIES)
+    else:
+        logged_in = 'itchio_token=' in stored['headers'].get('Cookie', '')
+    if not logged_in:
+        return 'missing'
+    if not stored['expires']:
+        return 'unknown'
+    return 'valid' if stored['expires'] - margin > time.time() else 'expired'
+
+def session_expires():
+    """Unix time the stored session expires at, or None."""
+    stored = read_store()
+    return stored['expires'] if stored else None
 
 def clear_credentials():
     if os.path.exists(cred_file_path):
@@ -61,6 +138,7 @@ def main():
     parser.add_argument('--store', help='Store credentials provided as JSON string')
     parser.add_argument('--fetch', action='store_true', help='Fetch and display stored credentials')
     parser.add_argument('--clear', action='store_true', help='Clear stored credentials')
+    parser.add_argument('--status', action='store_true', help='Show whether the stored session is still valid')
 
     args = parser.parse_args()
 
@@ -71,13 +149,17 @@ def main():
         except json.JSONDecodeError:
             log.error("Invalid JSON string provided for --store")
     elif args.fetch:
-        credentials = fetch_credentials()
+        credentials = read_store()
         if credentials:
             print(json.dumps(credentials, indent=2))
     elif args.clear:
         clear_credentials()
+    elif args.status:
+        status = session_status()
+        expires = session_expires()
+        print(f"Session {status}" + (f", expires {time.strftime('%Y-%m-%d %H:%M:%S %Z', time.localtime(expires))}" if expires else ""))
     else:
-        log.info("No valid argument provided. Use --store, --fetch, or --clear")
+        log.info("No valid argument provided. Use --store, --fetch, --clear, or --status")
 
 if __name__ == "__main__":
     main()
@@ -1,10 +1,13 @@
-import requests
 from bs4 import BeautifulSoup
 import re
+import threading
+from datetime import datetime
+from urllib.parse import urlsplit
+import itchhttp
 import itchylog as log
 
 def fetch_html(url):
-    response = requests.get(url)
+    response = itchhttp.get_cached(url)
     if response.status_code == 200:
         response.encoding = 'utf-8'  # Explicitly setting encoding to 'utf-8'
         return BeautifulSoup(response.text, 'html.parser')
@@ -12,6 +15,29 @@ def fetch_html(url):
         print(f"Failed to retrieve the page {url}. Status code: {response.status_code}")
         return None
 
+# Formats of the info panel dates: the abbr title, the visible text, and values already stored as ISO-8601
+DATE_FORMATS = ['%d %B %Y @ %H:%M UTC', '%b %d, %Y', '%B %d, %Y', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d']
+
+def parse_date(value):
+    """Parse an info panel date into ISO-8601, keeping the original text if it isn't a known format."""
+    if not value:
+        return None
+    for date_format in DATE_FORMATS:
+        try:
+            parsed = datetime.strptime(value.strip(), date_format)
+        except ValueError:
+            continue
+        return parsed.strftime('%Y-%m-%d %H:%M:%S' if '%H' in date_format else '%Y-%m-%d')
+    log.warning("Unrecognised date format: %s", value)
+    return value
+
+def parse_number(value, number_type, default=None):
+    """Parse a rating or a count, e.g. '4.5' or '3 files', into a number."""
+    if value is None or isinstance(value, (int, float)):
+        return value if value is not None else default
+    match = re.search(r'[\d\.]+', value.replace(',', ''))
+    return number_type(float(match.group())) if match else default
+
 def extract_game_page_info(soup):
     info_panel = soup.select_one('.info_panel_wrapper')
     if not info_panel:
@@ -32,18 +58,18 @@ def extract_game_page_info(soup):
             rating_match = re.search(r'Rated ([\d\.]+) out of 5 stars', value)
             rating_count_element = cells[1].find('span', {'itemprop': 'ratingCount'})
             rating_count = rating_count_element['content'] if rating_count_element else ''
-            game_info['Stars'] = rating_match.group(1) if rating_match else ''
-            game_info['RatingCount'] = rating_count
+            game_info['Stars'] = parse_number(rating_match.group(1), float) if rating_match else None
+            game_info['RatingCount'] = parse_number(rating_count, int)
         elif key == 'Genre':
             game_info['Genre'] = value
         elif key == 'Average session':
             game_info['AverageSession'] = value
         elif key == 'Languages':
             game_info['Languages'] = value
-        elif key == 'Updated':
-            game_info['Updated'] = value
-        elif key == 'Published':
-            game_info['Published'] = value
+        elif key in ('Updated', 'Published'):
+            # The abbr title carries the full timestamp, the visible text only the day
+            abbr = cells[1].find('abbr', title=True)
+            game_info[key] = parse_date(abbr['title'] if abbr else value)
         elif key == 'Status':
             game_info['Status'] = value
         elif key == 'Inputs':
@@ -55,11 +81,11 @@ def extract_game_page_info(soup):
         elif key == 'Tags':
             game_info['Tags'] = value
         elif key == 'Release date':
-            game_info['ReleaseDate'] = value
+            game_info['ReleaseDate'] = parse_date(value)
         elif key == 'Links':
             links = [a['href'] for a in cells[1].find_all('a', href=True)]
             game_info['Links'] = links
-            log.debug(f"Links: {game_info['Links']}")
+            log.debug("Links: %s", game_info['Links'])
         elif key == 'Mentions':
             mentions = [a['href'] for a in cells[1].find_all('a', href=True)]
         else:
@@ -68,16 +94,61 @@ def extract_game_page_info(soup):
     if mentions:
         other_info.append(f"Mentions={', '.join(mentions)}")
     game_info['Other'] = "; ".join(other_info)
-    log.debug(f"Concatenated 'Other' field: {game_info['Other']}")
+    log.debug("Concatenated 'Other' field: %s", game_info['Other'])
     return game_info
 
+def canonical_game_url(url):
+    """Key a game page by host and path, so the same game linked from several bundles maps to one entry."""
+    parts = urlsplit(url)
+    return f"{parts.netloc.lower()}{parts.path.rstrip('/')}"
+
+# Game page info fetched during this crawl, keyed by canonical game URL
+_game_info_memo = {}
+_game_info_memo_lock = threading.Lock()
+
+def clear_game_info_memo():
+    with _game_info_memo_lock:
+        _game_info_memo.clear()
+
 def fetch_additional_game_info(url):
+    """Fetch the info panel of a game page at most once per crawl, even when called from several threads."""
+    key = canonical_game_url(url)
+    with _game_info_memo_lock:
+        entry = _game_info_memo.setdefault(key, {'lock': threading.Lock(), 'info': None})
+    with entry['lock']:
+        if entry['info'] is None:
+            entry['info'] = _fetch_additional_game_info(url)
+            if entry['info'] is None:
+                # A failed fetch is not remembered, the next appearance of the game retries it
+                return {}
+        else:
+            log.debug("Game page info of %s already fetched during this crawl", key)
+    return entry['info']
+
+def game_info_fetched(url):
+    """Whether the game page of url was fetched successfully during this crawl."""
+    with _game_info_memo_lock:
+        entry = _game_info_memo.get(canonical_game_url(url))
+    return entry is not None and entry['info'] is not None
+
+def _fetch_additional_game_info(url):
     soup = fetch_html(url)
     if not soup:
-        return {}
+        return None
     game_page_info = extract_game_page_info(soup)
     if game_page_info:
         return game_page_info
     else:
         print("No game information found.")
         return {}
+
+def fetch_additional_game_info_if_modified(url):
+    """Like fetch_additional_game_info, but returns None when the game page is unchanged since it was cached."""
+    response = itchhttp.get_cached(url)
+    if response.status_code != 200:
+        print(f"Failed to retrieve the page {url}. Status code: {response.status_code}")
+        return None
+    if response.from_cache:
+        return None
+    response.encoding = 'utf-8'  # Explicitly setting encoding to 'utf-8'
+    return extract_game_page_info(BeautifulSoup(response.text, 'html.parser')) or {}
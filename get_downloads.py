@@ -1,23 +1,29 @@
 import os
+import json
+import hashlib
+import time
+import threading
+import http.client
 import requests
+import urllib3
 from bs4 import BeautifulSoup
-from cred_store import fetch_credentials
 import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urlparse
+import itchdb
+import itchhttp
 import itchylog as log
 
-# Fetch headers for the request
-headers = fetch_credentials()
-
-def fetch_html(url, headers):
+def fetch_html(url, headers=None):
     try:
-        response = requests.get(url, headers=headers)
-        log.info(f"Fetching HTML content from {url}")
+        response = itchhttp.get_cached(url, headers=headers)
+        log.info("Fetching HTML content from %s", url)
         response.raise_for_status()
         response.encoding = 'utf-8'  # Explicitly setting encoding to 'utf-8'
         return BeautifulSoup(response.text, 'html.parser')
     except requests.exceptions.RequestException as e:
-        log.error(f"Error fetching HTML content: {e}")
+        log.error("Error fetching HTML content: %s", e)
         return None
 
 def extract_download_info(html_content):
@@ -36,11 +42,27 @@ def extract_download_info(html_content):
                 'upload_id': upload_id,
                 'title': upload_name_tag['title'] if upload_name_tag else 'Unknown',
                 'file_size': file_size_tag.text if file_size_tag else 'Unknown',
+                'marker': upload_marker(upload),
                 'source': 'game_download',
                 'key': None  # Key will be dynamically set later
             })
     return download_data
 
+def upload_marker(upload):
+    """
+    What changes when an upload is replaced: its upload date, and the version of a build pushed with
+    butler. None when the page shows neither.
+    """
+    parts = []
+    date_tag = upload.find(class_='upload_date')
+    if date_tag:
+        abbr = date_tag.find('abbr')
+        parts.append(abbr.get('title') if abbr and abbr.get('title') else date_tag.get_text(strip=True))
+    version_tag = upload.find(class_='version_name')
+    if version_tag:
+        parts.append(version_tag.get_text(strip=True))
+    return ' | '.join(parts) or None
+
 def construct_download_url(base_url, upload_id, source, key):
     return f"{base_url}/file/{upload_id}?source={source}&key={key}"
 
@@ -53,35 +75,473 @@ def get_file_name(html_content, upload_id):
             return name_tag['title']
     return f"file_{upload_id}.zip"
 
-def follow_redirect_and_download(url, file_name, dest_folder, headers):
-    local_filename = os.path.join(dest_folder, file_name)
+def local_file_names(html_content, download_data):
+    """
+    {upload_id: local file name} of the uploads of a download page. Uploads sharing a name get their
+    upload id added to it, so they don't overwrite each other's file and .part file.
+    """
+    names = {data['upload_id']: get_file_name(html_content, data['upload_id']) for data in download_data}
+    counts = Counter(names.values())
+    for upload_id, name in names.items():
+        if counts[name] > 1:
+            stem, extension = os.path.splitext(name)
+            names[upload_id] = f"{stem}-{upload_id}{extension}"
+    return names
+
+# Suffix of the file a download is written to until it is complete
+PART_SUFFIX = '.part'
+# Bytes received between two updates of the .part.json sidecar
+PART_STATE_EVERY = 8 * 1024 * 1024
+# Uploads are split so each segment of a segmented download is at least this big
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+# Size of the reusable buffer downloads are read into, bigger blocks mean fewer Python-level reads and writes
+DOWNLOAD_BUFFER_SIZE = 1024 * 1024
+# Seconds to wait before the first retry of an interrupted download, grows with each attempt
+RETRY_DELAY = 2
+
+class DownloadProgress:
+    """Combined progress of the files downloading at once, printed as a single line."""
+    def __init__(self, file_count, interval=0.5):
+        self.lock = threading.Lock()
+        self.file_count = file_count
+        self.interval = interval
+        self.received = {}
+        self.totals = {}
+        self.done = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+        self.last_report = 0
+
+    def start(self, file_name, total, received=0):
+        with self.lock:
+            self.received[file_name] = received
+            self.totals[file_name] = total
+
+    def advance(self, file_name, size):
+        with self.lock:
+            self.received[file_name] = self.received.get(file_name, 0) + size
+            if time.monotonic() - self.last_report >= self.interval:
+                self.report()
+
+    def finish(self, file_name, succeeded):
+        with self.lock:
+            if succeeded:
+                self.done += 1
+            else:
+                self.failed += 1
+            self.report()
+
+    def report(self):
+        self.last_report = time.monotonic()
+        received = sum(self.received.values())
+        total = sum(self.totals.values())
+        elapsed = max(self.last_report - self.started_at, 0.001)
+        print(f"\r{self.done}/{self.file_count} files done, {self.failed} failed, "
+              f"{received / (1024 * 1024):.1f}/{total / (1024 * 1024):.1f} MiB "
+              f"at {received / (1024 * 1024) / elapsed:.1f} MiB/s", end='', flush=True)
+
+def read_part_state(part_filename):
+    """
+    Bytes received, expected total and segments ([start, end, received] lists, None for a single
+    stream) of an interrupted download, from its .part file and sidecar.
+    """
+    sidecar = part_filename + '.json'
+    if not (os.path.exists(part_filename) and os.path.exists(sidecar)):
+        return 0, None, None
+    try:
+        with open(sidecar) as file:
+            state = json.load(file)
+    except (OSError, ValueError) as e:
+        log.warning("Ignoring unreadable download state %s: %s", sidecar, e)
+        return 0, None, None
+    if state.get('segments'):
+        return state.get('received', 0), state.get('total'), state['segments']
+    # The sidecar is written after the data is flushed, so the file may hold more, never less
+    return min(state.get('received', 0), os.path.getsize(part_filename)), state.get('total'), None
+
+def write_part_state(part_filename, received, total, segments=None):
+    state = {'received': received, 'total': total}
+    if segments:
+        state['segments'] = segments
+    with open(part_filename + '.json', 'w') as file:
+        json.dump(state, file)
+
+def remove_part_state(part_filename):
+    for path in (part_filename, part_filename + '.json'):
+        if os.path.exists(path):
+            os.remove(path)
+
+def content_range_total(response):
+    """Total size from a 'bytes start-end/total' or 'bytes */total' Content-Range header."""
+    content_range = response.headers.get('Content-Range', '')
+    total = content_range.rsplit('/', 1)[-1]
+    return int(total) if total.isdigit() else None
+
+def hash_file(path, length=None):
+    """sha256 of the first `length` bytes of path (the whole file by default), to continue hashing a resumed download."""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file:
+        remaining = length
+        while remaining is None or remaining > 0:
+            block = file.read(1024 * 1024 if remaining is None else min(1024 * 1024, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return hasher
+
+def is_downloaded(upload, local_filename, verify=False):
+    """
+    True when the manifest shows this upload unchanged on itch.io and already on disk. The upload date
+    and build are compared with the page, and the file is checked with a stat call. It is only hashed
+    against the stored checksum when its mtime changed, or always with `verify`.
+    """
+    entry = itchdb.get_download(upload['upload_id'])
+    if entry is None or entry['Path'] != os.path.abspath(local_filename):
+        return False
+    marker = upload.get('marker')
+    if entry['UploadMarker'] and marker and entry['UploadMarker'] != marker:
+        log.info("Upload %s was replaced on itch.io (%s -> %s), downloading it again", upload['upload_id'], entry['UploadMarker'], marker)
+        return False
+    if entry['ListedSize'] != upload['file_size']:
+        log.info("Upload %s changed on itch.io (%s -> %s), downloading it again", upload['upload_id'], entry['ListedSize'], upload['file_size'])
+        return False
     try:
-        print(f"Attempting Download of '{file_name}'")
-        log.info(f"Initiating download request to {url}")
-        with requests.post(url, headers=headers) as response:
-            log.debug(f"Initial response status code: {response.status_code}")
-            log.debug(f"Initial response headers: {response.headers}")
-            response.raise_for_status()
-            json_data = response.json()
-            if 'url' in json_data:
-                download_url = json_data['url']
-                log.info(f"Following redirect to {download_url}")
-                with requests.get(download_url, headers=headers, stream=True) as download_response:
-                    log.debug(f"Download response status code: {download_response.status_code}")
-                    log.debug(f"Download response headers: {download_response.headers}")
-                    download_response.raise_for_status()
-                    with open(local_filename, 'wb') as file:
-                        for chunk in download_response.iter_content(chunk_size=8192):
-                            file.write(chunk)
-                    print(f"Downloaded: {local_filename}")
+        stat = os.stat(local_filename)
+    except OSError:
+        log.info("'%s' is in the download manifest but missing on disk, downloading it again", local_filename)
+        return False
+    if stat.st_size != entry['Size']:
+        log.info("'%s' changed size on disk since it was downloaded, downloading it again", local_filename)
+        return False
+    modified = stat.st_mtime_ns != entry['ModifiedNs']
+    if (verify or modified) and entry['Checksum']:
+        if hash_file(local_filename).hexdigest() != entry['Checksum']:
+            log.info("'%s' does not match its checksum, downloading it again", local_filename)
+            return False
+    elif modified:
+        log.info("'%s' changed on disk since it was downloaded, downloading it again", local_filename)
+        return False
+    if modified or (marker and not entry['UploadMarker']):
+        # A touched but intact file keeps its entry, and older entries learn the marker to compare next time
+        itchdb.update_download(upload['upload_id'], stat.st_mtime_ns if modified else None, marker)
+    return True
+
+def preallocate(file, size):
+    """Reserve the full size of a download up front, so the file isn't grown block by block."""
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(file.fileno(), 0, size)
+        except OSError as e:
+            # Some filesystems (e.g. network or FAT mounts) can't reserve space, a sparse file still works
+            log.debug("posix_fallocate not supported here (%s), falling back to truncate", e)
+    file.truncate(size)
+
+def read_blocks(response, buffer_size=None):
+    """
+    Read a streamed response body with readinto into one reusable buffer, yielding a view of each
+    filled block. A view is only valid until the next block is read.
+    An unencoded body is read straight from the http.client response into the buffer, urllib3's
+    readinto would allocate a new bytes per block and copy it over. Encoded bodies go through urllib3
+    so they are decompressed.
+    """
+    view = memoryview(bytearray(buffer_size or DOWNLOAD_BUFFER_SIZE))
+    fp = getattr(response.raw, '_fp', None)
+    if response.headers.get('Content-Encoding', 'identity').lower() == 'identity' and hasattr(fp, 'readinto'):
+        readinto = fp.readinto
+        protocol_errors = (http.client.IncompleteRead,)
+        connection_errors = (OSError, http.client.HTTPException)
+    else:
+        response.raw.decode_content = True
+        readinto = response.raw.readinto
+        protocol_errors = (urllib3.exceptions.ProtocolError,)
+        connection_errors = (urllib3.exceptions.HTTPError,)
+    while True:
+        try:
+            size = readinto(view)
+        except protocol_errors as e:
+            raise requests.exceptions.ChunkedEncodingError(e)
+        except connection_errors as e:
+            raise requests.exceptions.ConnectionError(e)
+        if not size:
+            return
+        yield view[:size]
+
+def request_download_url(url, headers=None):
+    """Ask the /file/{upload_id} endpoint for a signed CDN URL, these expire so each attempt gets a new one."""
+    log.info("Initiating download request to %s", url)
+    with itchhttp.post(url, headers=headers) as response:
+        log.debug("Initial response status code: %s", response.status_code)
+        log.debug("Initial response headers: %s", response.headers)
+        response.raise_for_status()
+        json_data = response.json()
+    if 'url' not in json_data:
+        log.error("No download URL found in response JSON: %s", json_data)
+        return None
+    return json_data['url']
+
+def stream_to_part(download_url, part_filename, file_name, received=0, total=None, headers=None, progress=None, buffer_size=None):
+    """
+    Stream a download into its .part file, continuing at `received` bytes with a Range request.
+    Returns (received, total, sha256), the sidecar is kept up to date so an interruption can be resumed.
+    """
+    request_headers = dict(headers or {})
+    if received:
+        request_headers['Range'] = f"bytes={received}-"
+    if received:
+        log.info("Following redirect to %s from byte %d", download_url, received)
+    else:
+        log.info("Following redirect to %s", download_url)
+    with itchhttp.get(download_url, headers=request_headers, stream=True) as download_response:
+        log.debug("Download response status code: %s", download_response.status_code)
+        log.debug("Download response headers: %s", download_response.headers)
+        if received and download_response.status_code == 416:
+            # Nothing left past `received`, the part file already holds the whole upload
+            return received, content_range_total(download_response) or total, hash_file(part_filename, received).hexdigest()
+        download_response.raise_for_status()
+        if received and download_response.status_code != 206:
+            log.warning("Server ignored the range request for '%s', starting over", file_name)
+            received = 0
+        content_length = download_response.headers.get('Content-Length')
+        total = content_range_total(download_response) or (received + int(content_length) if content_length else None)
+        if progress:
+            progress.start(file_name, total or 0, received)
+
+        # Hashed as it streams, a resumed download first hashes what the part file already holds
+        hasher = hash_file(part_filename, received) if received else hashlib.sha256()
+        saved = received
+        with open(part_filename, 'r+b' if received else 'wb') as file:
+            if total:
+                preallocate(file, total)
             else:
-                log.error(f"No download URL found in response JSON: {json_data}")
-    except requests.exceptions.RequestException as e:
-        log.error(f"Failed to download {url}: {e}")
+                file.truncate(received)
+            file.seek(received)
+            try:
+                for chunk in read_blocks(download_response, buffer_size):
+                    file.write(chunk)
+                    hasher.update(chunk)
+                    received += len(chunk)
+                    if progress:
+                        progress.advance(file_name, len(chunk))
+                    if received - saved >= PART_STATE_EVERY:
+                        file.flush()
+                        write_part_state(part_filename, received, total)
+                        saved = received
+            finally:
+                file.flush()
+                write_part_state(part_filename, received, total)
+    return received, total, hasher.hexdigest()
+
+def probe_ranges(download_url, headers=None):
+    """Size of the upload when the server answers range requests, None when it does not."""
+    request_headers = dict(headers or {})
+    request_headers['Range'] = 'bytes=0-0'
+    with itchhttp.get(download_url, headers=request_headers, stream=True) as response:
+        if response.status_code == 206:
+            return content_range_total(response)
+    return None
+
+def split_segments(total, segments):
+    """Split `total` bytes into at most `segments` [start, end, received] ranges of at least MIN_SEGMENT_SIZE."""
+    segments = max(1, min(segments, total // MIN_SEGMENT_SIZE))
+    size = -(-total // segments)
+    return [[start, min(start + size, total) - 1, 0] for start in range(0, total, size)]
+
+def fetch_segment(download_url, part_filename, file_name, segment, save_state, headers=None, progress=None, buffer_size=None):
+    """Stream one byte range straight to its offset in the preallocated .part file."""
+    start, end, received = segment
+    if start + received > end:
+        return
+    request_headers = dict(headers or {})
+    request_headers['Range'] = f"bytes={start + received}-{end}"
+    with itchhttp.get(download_url, headers=request_headers, stream=True) as response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise requests.exceptions.HTTPError(f"Range {start}-{end} of '{file_name}' answered with {response.status_code}")
+        saved = received
+        with open(part_filename, 'r+b') as file:
+            file.seek(start + received)
+            try:
+                for chunk in read_blocks(response, buffer_size):
+                    # Never write past the segment, even if the server sends more than asked
+                    chunk = chunk[:end + 1 - start - received]
+                    file.write(chunk)
+                    received += len(chunk)
+                    if progress:
+                        progress.advance(file_name, len(chunk))
+                    if received - saved >= PART_STATE_EVERY:
+                        file.flush()
+                        segment[2] = saved = received
+                        save_state()
+            finally:
+                # Only flushed bytes are recorded, the sidecar may lag behind the file but never lead it
+                file.flush()
+                segment[2] = received
+
+def segmented_download(download_url, part_filename, file_name, total, segments, headers=None, progress=None, buffer_size=None):
+    """
+    Fetch the byte ranges in `segments` over parallel connections into a .part file preallocated
+    to `total` bytes. Returns (received, total, sha256) like stream_to_part, segment progress is kept in the sidecar.
+    Segments arrive out of order, so the checksum is taken with one read of the finished file.
+    """
+    with open(part_filename, 'r+b' if os.path.exists(part_filename) else 'wb') as file:
+        preallocate(file, total)
+
+    state_lock = threading.Lock()
+    def save_state():
+        with state_lock:
+            write_part_state(part_filename, sum(segment[2] for segment in segments), total, segments)
+
+    pending = [segment for segment in segments if segment[0] + segment[2] <= segment[1]]
+    log.info("Fetching %s of %s segments of '%s' (%s bytes) from %s", len(pending), len(segments), file_name, total, download_url)
+    if progress:
+        progress.start(file_name, total, sum(segment[2] for segment in segments))
+    errors = []
+    with ThreadPoolExecutor(max_workers=max(len(pending), 1)) as executor:
+        futures = [executor.submit(fetch_segment, download_url, part_filename, file_name, segment, save_state, headers, progress, buffer_size)
+                   for segment in pending]
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except requests.exceptions.RequestException as e:
+                errors.append(e)
+    save_state()
+    if errors:
+        raise errors[0]
+    return sum(segment[2] for segment in segments), total, hash_file(part_filename).hexdigest()
+
+def follow_redirect_and_download(url, file_name, dest_folder, headers=None, progress=None, retries=3, segments=1, upload=None, verify=False, buffer_size=None):
+    """
+    Download one upload into a .part file, resuming an earlier interrupted attempt, and move it
+    into place once its size matches. With `segments` > 1 the upload is fetched as that many byte
+    ranges in parallel, if the server supports ranges. Given its `upload` info, an upload already in the
+    download manifest is skipped (after checking its checksum with `verify`) and a finished one is recorded.
+    `buffer_size` is the read buffer of each stream, DOWNLOAD_BUFFER_SIZE by default. Returns the local path or None when it failed.
+    """
+    local_filename = os.path.join(dest_folder, file_name)
+    part_filename = local_filename + PART_SUFFIX
+    # A download on its own reports its progress line itself, download_files shares one between its files
+    single = progress is None
+    if upload and is_downloaded(upload, local_filename, verify):
+        log.info("Skipping '%s', upload %s is already downloaded and unchanged", file_name, upload['upload_id'])
+        if single:
+            print(f"Already downloaded: {local_filename}")
+        return local_filename
 
+    received, total, segment_state = read_part_state(part_filename)
+    if single:
+        print(f"Attempting Download of '{file_name}'" + (f", resuming at {received} bytes" if received else ""))
+        progress = DownloadProgress(1)
+    started_at, resumed_at = time.monotonic(), received
 
+    for attempt in range(1, retries + 1):
+        try:
+            download_url = request_download_url(url, headers)
+            if download_url is None:
+                return None
+            if segments > 1 and not received and not segment_state:
+                range_total = probe_ranges(download_url, headers)
+                if range_total and range_total >= 2 * MIN_SEGMENT_SIZE:
+                    total = range_total
+                    segment_state = split_segments(total, segments)
+                else:
+                    log.info("Downloading '%s' as a single stream, %s", file_name, "it is too small to split" if range_total else "the server does not support ranges")
+            if segment_state:
+                received, total, checksum = segmented_download(download_url, part_filename, file_name, total, segment_state, headers, progress, buffer_size)
+            else:
+                received, total, checksum = stream_to_part(download_url, part_filename, file_name, received, total, headers, progress, buffer_size)
+            if total is None or received == total:
+                os.replace(part_filename, local_filename)
+                remove_part_state(part_filename)
+                if upload:
+                    itchdb.record_download(upload['upload_id'], upload.get('game_id'), local_filename, checksum, upload['file_size'], upload.get('marker'))
+                elapsed = max(time.monotonic() - started_at, 0.001)
+                rate = f"{(received - resumed_at) / (1024 * 1024):.1f} MiB in {elapsed:.1f}s, {(received - resumed_at) / (1024 * 1024) / elapsed:.1f} MiB/s"
+                log.info("Downloaded '%s' (%s)", file_name, rate)
+                if single:
+                    progress.finish(file_name, True)
+                    print(f"\nDownloaded: {local_filename} ({rate})")
+                return local_filename
+            log.error("Size check failed for '%s': received %s of %s bytes (attempt %s/%s)", file_name, received, total, attempt, retries)
+            if received > total:
+                remove_part_state(part_filename)
+        except requests.exceptions.RequestException as e:
+            log.error("Failed to download %s (attempt %s/%s): %s", url, attempt, retries, e)
+        received, total, segment_state = read_part_state(part_filename)
+        if attempt < retries:
+            time.sleep(RETRY_DELAY * attempt)
+    log.error("Giving up on '%s', %s bytes kept in %s for the next run", file_name, received, part_filename)
+    if single:
+        progress.finish(file_name, False)
+        print()
+    return None
+
+def download_files(downloads, dest_folder, workers=1, segments=1, verify=False, buffer_size=None):
+    """
+    Download (download_url, file_name, upload) entries, `workers` at a time. Each file gets its own signed URL
+    and stream, and a failure is logged and reported without stopping the others.
+    """
+    if workers <= 1 or len(downloads) <= 1:
+        return [follow_redirect_and_download(download_url, file_name, dest_folder, segments=segments, upload=upload, verify=verify, buffer_size=buffer_size)
+                for download_url, file_name, upload in downloads]
+
+    print(f"Downloading {len(downloads)} files with {workers} workers")
+    progress = DownloadProgress(len(downloads))
+    # Results are keyed by upload, two uploads may share a file name
+    keys = [upload['upload_id'] if upload else index for index, (_, _, upload) in enumerate(downloads)]
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(follow_redirect_and_download, download_url, file_name, dest_folder,
+                                   progress=progress, segments=segments, upload=upload, verify=verify,
+                                   buffer_size=buffer_size): (key, file_name)
+                   for key, (download_url, file_name, upload) in zip(keys, downloads)}
+        for future in as_completed(futures):
+            key, file_name = futures[future]
+            try:
+                results[key] = future.result()
+            except Exception as e:
+                log.error("Download of '%s' failed: %s", file_name, e)
+                results[key] = None
+            progress.finish(file_name, results[key] is not None)
+    print()
+
+    failed = [file_name for key, (_, file_name, _) in zip(keys, downloads) if results[key] is None]
+    for key in keys:
+        if results[key]:
+            print(f"Downloaded: {results[key]}")
+    if failed:
+        print(f"Failed to download {len(failed)} files: {', '.join(failed)}")
+    return [results[key] for key in keys]
+
+def all_downloads(base_url, html_content, download_data):
+    file_names = local_file_names(html_content, download_data)
+    return [(construct_download_url(base_url, data['upload_id'], data['source'], data['key']), file_names[data['upload_id']], data)
+            for data in download_data]
 
-def main(url, dest_folder, key, download_all, specific_file):
+def download_game(url, dest_folder, key=None, game_id=None, workers=4, segments=1, verify=False, buffer_size=None):
+    """
+    Download every file of a game's download page without prompting, for batch use.
+    Returns the names of the files that failed, or None when the page had no downloads to read.
+    """
+    parsed_url = urlparse(url)
+    base_url = f"{parsed_url.scheme}://{parsed_url.netloc}/{parsed_url.path.split('/')[1]}"
+    key = key or url.split('/')[-1]
+    html_content = fetch_html(url)
+    download_data = extract_download_info(html_content)
+    if not download_data:
+        log.error("No download links found on %s", url)
+        return None
+    itchdb.ensure_download_manifest()
+    for data in download_data:
+        data['key'] = key
+        data['game_id'] = game_id
+    os.makedirs(dest_folder, exist_ok=True)
+    downloads = all_downloads(base_url, html_content, download_data)
+    results = download_files(downloads, dest_folder, workers, segments, verify, buffer_size)
+    return [file_name for (_, file_name, _), path in zip(downloads, results) if path is None]
+
+def main(url, dest_folder, key, download_all, specific_file, workers=4, segments=1, game_id=None, verify=False, buffer_size=None):
     parsed_url = urlparse(url)
     base_url = f"{parsed_url.scheme}://{parsed_url.netloc}/{parsed_url.path.split('/')[1]}"
     
@@ -90,7 +550,7 @@ def main(url, dest_folder, key, download_all, specific_file):
         key = url.split('/')[-1]
     
     # Log the key being used
-    log.info(f"Using key: {key}")
+    log.info("Using key: %s", key)
 
     # Check if URL contains '/download/'
     if '/download/' not in url:
@@ -101,15 +561,19 @@ def main(url, dest_folder, key, download_all, specific_file):
     # Check if URL ends with the provided key
     if key and not url.endswith(key):
         log.warning("\n" + "="*60)
-        log.warning(f"WARNING: The URL does not end with the key '{key}'. This may not work correctly.")
+        log.warning("WARNING: The URL does not end with the key '%s'. This may not work correctly.", key)
         log.warning("="*60 + "\n")
     
-    html_content = fetch_html(url, headers)
+    html_content = fetch_html(url)
     if html_content:
         download_data = extract_download_info(html_content)
         if download_data:
+            itchdb.ensure_download_manifest()
+            if game_id is None:
+                game_id = itchdb.get_game_id_by_dl_page(url)
             for data in download_data:
                 data['key'] = key
+                data['game_id'] = game_id
             print("Download links found:")
             for index, data in enumerate(download_data, start=1):
                 print(f"{index}. Title: {data['title']}, File Size: {data['file_size']}, Link: {construct_download_url(base_url, data['upload_id'], data['source'], data['key'])}")
@@ -119,32 +583,26 @@ def main(url, dest_folder, key, download_all, specific_file):
                 for data in download_data:
                     if data['title'] == specific_file:
                         download_url = construct_download_url(base_url, data['upload_id'], data['source'], data['key'])
-                        file_name = get_file_name(html_content, data['upload_id'])
-                        follow_redirect_and_download(download_url, file_name, dest_folder, headers)
+                        file_name = local_file_names(html_content, download_data)[data['upload_id']]
+                        follow_redirect_and_download(download_url, file_name, dest_folder, segments=segments, upload=data, verify=verify, buffer_size=buffer_size)
                         file_found = True
                         break
                 if not file_found:
-                    log.error(f"File '{specific_file}' not found in the available downloads.")
+                    log.error("File '%s' not found in the available downloads.", specific_file)
             elif download_all:
-                for data in download_data:
-                    download_url = construct_download_url(base_url, data['upload_id'], data['source'], data['key'])
-                    file_name = get_file_name(html_content, data['upload_id'])
-                    follow_redirect_and_download(download_url, file_name, dest_folder, headers)
+                download_files(all_downloads(base_url, html_content, download_data), dest_folder, workers, segments, verify, buffer_size)
             else:
                 choice = input("Enter the number of the file you want to download, or type 'all' to download all files: ").strip()
                 if choice.lower() in ['a', 'all']:
-                    for data in download_data:
-                        download_url = construct_download_url(base_url, data['upload_id'], data['source'], data['key'])
-                        file_name = get_file_name(html_content, data['upload_id'])
-                        follow_redirect_and_download(download_url, file_name, dest_folder, headers)
+                    download_files(all_downloads(base_url, html_content, download_data), dest_folder, workers, segments, verify, buffer_size)
                 else:
                     try:
                         choice_index = int(choice) - 1
                         if 0 <= choice_index < len(download_data):
                             data = download_data[choice_index]
                             download_url = construct_download_url(base_url, data['upload_id'], data['source'], data['key'])
-                            file_name = get_file_name(html_content, data['upload_id'])
-                            follow_redirect_and_download(download_url, file_name, dest_folder, headers)
+                            file_name = local_file_names(html_content, download_data)[data['upload_id']]
+                            follow_redirect_and_download(download_url, file_name, dest_folder, segments=segments, upload=data, verify=verify, buffer_size=buffer_size)
                         else:
                             log.error("Invalid choice.")
                     except ValueError:
@@ -162,7 +620,15 @@ if __name__ == "__main__":
     parser.add_argument('--key', help='The key for the download. If not provided, it will be extracted from the URL.')
     parser.add_argument('--all', action='store_true', help='Download all available files.')
     parser.add_argument('--file', help='Download a specific file by name.')
+    parser.add_argument('--workers', type=int, default=4, help='Number of files downloaded at once when downloading all files (1 downloads them one by one).')
+    parser.add_argument('--segments', type=int, default=1, help='Split each large file into this many byte ranges fetched over parallel connections.')
+    parser.add_argument('--verify', action='store_true', help='Check files already downloaded against their stored sha256 before skipping them.')
+    parser.add_argument('--buffer-mib', type=int, default=1, help='Size in MiB of the buffer each download stream is read into.')
 
+    parser.add_argument('--log-level', help="Level of the log written to out/ (DEBUG, INFO, WARNING...), DEBUG by default.")
     args = parser.parse_args()
+    if args.log_level:
+        log.set_level(args.log_level)
 
-    main(args.url, args.dest, args.key, args.all, args.file)
+    main(args.url, args.dest, args.key, args.all, args.file, args.workers, args.segments, verify=args.verify,
+         buffer_size=args.buffer_mib * 1024 * 1024)
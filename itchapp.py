@@ -0,0 +1,56 @@
+import importlib
+import itchdb
+import itchylog as log
+
+def init_database(db_file='itch.db', table_name='Game', reset=False):
+    """Create the database if it is missing, or start it over with `reset`. Returns True once the table exists."""
+    if reset or not itchdb.db_file_exists(db_file) or not itchdb.table_exists(db_file, table_name):
+        itchdb.clean_database(db_file, table_name)
+        itchdb.create_db(db_file, table_name)
+    return itchdb.table_exists(db_file, table_name)
+
+def log_in(username=None, password=None, force=False):
+    """
+    Reuse the stored session, or log in when it is missing or about to expire (always with `force`).
+    Missing username/password are asked for only if a login is needed. The shared HTTP session is
+    reopened so it sends the stored cookies.
+    """
+    import itchhttp
+    from login import ensure_logged_in
+    logged_in = ensure_logged_in(username, password, force)
+    if logged_in:
+        itchhttp.reset_session()
+    return logged_in
+
+def crawl_library(use_async=True, sync=False, refresh=False, **options):
+    """Crawl the bundles into the database, or only sync new purchases with `sync` (see my-bundles.main for options)."""
+    my_bundles = importlib.import_module('my-bundles')
+    my_bundles.main(use_async=use_async, sync=sync, refresh=refresh, **options)
+
+def sync_library(refresh=False):
+    """Add games bought since the last crawl, and update known games whose page changed with `refresh`."""
+    crawl_library(sync=True, refresh=refresh)
+
+def report(db_file='itch.db', table_name='Game'):
+    """Print what the database holds: games, bundles, crawl progress, downloads and the download queue."""
+    if not itchdb.db_file_exists(db_file) or not itchdb.table_exists(db_file, table_name):
+        print("There is no game database yet, run the setup first.")
+        return
+    itchdb.create_db(db_file, table_name)
+    conn = itchdb.get_connection(db_file)
+    games = itchdb.count_rows(db_file, table_name)
+    bundles = conn.execute(f'SELECT COUNT(DISTINCT BundleURL) FROM Bundle{table_name}').fetchone()[0]
+    print(f"{games} games from {bundles} bundles.")
+    if games == 0:
+        print("Library crawl: not run yet.")
+    elif itchdb.crawl_complete(db_file):
+        skipped = itchdb.get_skipped_crawl_items(db_file)
+        print("Library crawl: complete." + (f" {len(skipped)} pages or games were given up on (my-bundles.py --retry-skipped)." if skipped else ""))
+    else:
+        print(f"Library crawl: interrupted, {itchdb.get_crawl_status(db_file)}.")
+    downloads, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(Size), 0) FROM DownloadManifest').fetchone()
+    print(f"{downloads} files downloaded, {size / (1024 * 1024 * 1024):.1f} GiB.")
+    queue_status = itchdb.get_queue_status(db_file)
+    if queue_status:
+        print("Download queue: " + ', '.join(f"{count} {status}" for status, count in sorted(queue_status.items())) + ".")
+    log.info("Report: %s games, %s bundles, %s downloads, queue %s", games, bundles, downloads, queue_status)
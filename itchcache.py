@@ -0,0 +1,178 @@
+import os
+import time
+import zlib
+import sqlite3
+import threading
+import weakref
+import argparse
+import itchylog as log
+
+cache_file_path = os.path.join('out', 'http_cache.db')
+
+# Entries not revalidated for this long are dropped
+MAX_AGE_SECONDS = 30 * 24 * 60 * 60
+# Least recently used entries are dropped once the stored bodies exceed this size
+MAX_SIZE_BYTES = 256 * 1024 * 1024
+# Eviction runs on first use and then once every this many stores
+EVICT_EVERY = 200
+
+_stores_since_evict = None
+
+# Each thread keeps one connection per cache file, the schema is only created by the first one
+_local = threading.local()
+_connections = []
+_connections_lock = threading.RLock()
+_schema_ready = set()
+
+class _ThreadConnections(dict):
+    """One thread's cache connections by path, dropped with the thread's threading.local when it exits."""
+
+def _discard_connection(conn):
+    # Finalizer of a _ThreadConnections, so the threads of each crawl or sync don't leave their connection open
+    with _connections_lock:
+        _connections[:] = [entry for entry in _connections if entry[2] is not conn]
+    conn.close()
+
+def connect(cache_file=cache_file_path):
+    """Open a new connection to the cache, creating the file and its schema if needed."""
+    os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+    conn = sqlite3.connect(cache_file, timeout=30, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('''CREATE TABLE IF NOT EXISTS Response (
+                    URL TEXT PRIMARY KEY,
+                    ETag TEXT,
+                    LastModified TEXT,
+                    Body BLOB,
+                    Size INTEGER,
+                    FetchedAt REAL,
+                    AccessedAt REAL
+                )''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_response_accessed ON Response (AccessedAt)')
+    conn.commit()
+    return conn
+
+def get_connection(cache_file=cache_file_path):
+    """Return this thread's connection to the cache, opening it on first use. It is closed when the thread exits."""
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = _ThreadConnections()
+    path = os.path.abspath(cache_file)
+    conn = connections.get(path)
+    if conn is None:
+        with _connections_lock:
+            if path in _schema_ready:
+                conn = sqlite3.connect(cache_file, timeout=30, check_same_thread=False)
+            else:
+                conn = connect(cache_file)
+                _schema_ready.add(path)
+            _connections.append((weakref.ref(connections), path, conn))
+        connections[path] = conn
+        weakref.finalize(connections, _discard_connection, conn)
+    return conn
+
+def close_connections(cache_file=None):
+    """Close the cache connections of every thread, to cache_file only if given (e.g. before deleting it)."""
+    path = os.path.abspath(cache_file) if cache_file else None
+    with _connections_lock:
+        closing = [entry for entry in _connections if path is None or entry[1] == path]
+        _connections[:] = [entry for entry in _connections if not (path is None or entry[1] == path)]
+        if path is None:
+            _schema_ready.clear()
+        else:
+            _schema_ready.discard(path)
+    for connections_ref, entry_path, conn in closing:
+        conn.close()
+        connections = connections_ref()
+        if connections is not None:
+            connections.pop(entry_path, None)
+
+def lookup(url, cache_file=cache_file_path):
+    """Return (etag, last_modified, body) of the cached response for url, or None."""
+    row = get_connection(cache_file).execute('SELECT ETag, LastModified, Body FROM Response WHERE URL = ?', (url,)).fetchone()
+    if row is None:
+        return None
+    etag, last_modified, body = row
+    return etag, last_modified, zlib.decompress(body)
+
+def conditional_headers(entry):
+    """Validators to send for a cached entry, so an unchanged page comes back as a 304."""
+    headers = {}
+    if entry:
+        etag, last_modified, _ = entry
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+    return headers
+
+def store(url, etag, last_modified, content, cache_file=cache_file_path):
+    global _stores_since_evict
+    body = zlib.compress(content)
+    now = time.time()
+    with get_connection(cache_file) as conn:
+        conn.execute('''INSERT OR REPLACE INTO Response (URL, ETag, LastModified, Body, Size, FetchedAt, AccessedAt)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)''', (url, etag, last_modified, body, len(body), now, now))
+
+    if _stores_since_evict is None or _stores_since_evict >= EVICT_EVERY:
+        _stores_since_evict = 0
+        evict(cache_file=cache_file)
+    _stores_since_evict += 1
+
+def touch(url, cache_file=cache_file_path):
+    """Mark a cached entry as revalidated and recently used."""
+    now = time.time()
+    with get_connection(cache_file) as conn:
+        conn.execute('UPDATE Response SET FetchedAt = ?, AccessedAt = ? WHERE URL = ?', (now, now, url))
+
+def evict(max_age=MAX_AGE_SECONDS, max_size=MAX_SIZE_BYTES, cache_file=cache_file_path):
+    with get_connection(cache_file) as conn:
+        expired = conn.execute('DELETE FROM Response WHERE FetchedAt < ?', (time.time() - max_age,)).rowcount
+        total_size = conn.execute('SELECT COALESCE(SUM(Size), 0) FROM Response').fetchone()[0]
+        evicted = 0
+        if total_size > max_size:
+            # Walk entries from least recently used and drop them until the cache fits
+            excess = total_size - max_size
+            for url, size in conn.execute('SELECT URL, Size FROM Response ORDER BY AccessedAt').fetchall():
+                if excess <= 0:
+                    break
+                conn.execute('DELETE FROM Response WHERE URL = ?', (url,))
+                excess -= size
+                evicted += 1
+    log.info("HTTP cache eviction: %s expired, %s evicted for size", expired, evicted)
+    return expired, evicted
+
+def stats(cache_file=cache_file_path):
+    return get_connection(cache_file).execute('SELECT COUNT(*), COALESCE(SUM(Size), 0) FROM Response').fetchone()
+
+def clear_cache(cache_file=cache_file_path):
+    close_connections(cache_file)
+    if os.path.exists(cache_file):
+        for path in (cache_file, f"{cache_file}-wal", f"{cache_file}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+        print("The HTTP cache has been deleted.")
+        log.info("HTTP cache cleared")
+    else:
+        log.warning("HTTP cache file does not exist")
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the on-disk HTTP cache of itch.io pages.")
+    parser.add_argument('--stats', action='store_true', help='Print the number of cached pages and their size')
+    parser.add_argument('--evict', action='store_true', help='Drop expired entries and shrink the cache to its size limit')
+    parser.add_argument('--clear', action='store_true', help='Delete the cache')
+
+    args = parser.parse_args()
+
+    if args.stats:
+        count, size = stats()
+        print(f"{count} cached pages, {size / (1024 * 1024):.1f} MiB")
+    elif args.evict:
+        expired, evicted = evict()
+        print(f"Dropped {expired} expired and {evicted} least recently used pages.")
+    elif args.clear:
+        clear_cache()
+    else:
+        log.info("No valid argument provided. Use --stats, --evict, or --clear")
+
+if __name__ == "__main__":
+    main()
@@ -1,82 +1,534 @@
+import re
+import json
 import sqlite3
 import os
+import time
+import queue
+import threading
+import weakref
 import argparse
 import itchylog as log
 
+GAME_COLUMNS = ['Title', 'Developer', 'ImageURL', 'HomePage', 'Key', 'DLPage', 'FileCount', 'Platforms', 'Description', 'Download',
+                'Stars', 'RatingCount', 'Author', 'Genre', 'AverageSession', 'Languages', 'Updated', 'Published', 'Status',
+                'Inputs', 'Accessibility', 'Tags', 'ReleaseDate', 'Other']
+GAME_INFO_COLUMNS = GAME_COLUMNS[GAME_COLUMNS.index('Stars'):]
+# Columns stored as numbers or ISO-8601 dates, everything else is TEXT
+TYPED_COLUMNS = {'FileCount': 'INTEGER', 'Stars': 'REAL', 'RatingCount': 'INTEGER',
+                 'Updated': 'TEXT', 'Published': 'TEXT', 'ReleaseDate': 'TEXT'}
+# Columns commonly used in range filters and sorting
+INDEXED_COLUMNS = ['Developer', 'Stars', 'RatingCount', 'Updated', 'Published', 'ReleaseDate']
+
+# Tuned once per connection: memory-mapped reads, a 64 MiB page cache and in-memory temp tables for sorts
+CONNECTION_PRAGMAS = {'mmap_size': 256 * 1024 * 1024, 'cache_size': -64 * 1024, 'temp_store': 'MEMORY'}
+# Compiled statements kept per connection, so repeated lookups skip SQL parsing and planning
+CACHED_STATEMENTS = 256
+# A crawl page or game still failing after this many attempts is skipped, and no longer keeps the crawl from completing
+MAX_CRAWL_ATTEMPTS = 3
+# Stored in PRAGMA user_version by create_db, bump it when create_db gains a table, index or migration
+SCHEMA_VERSION = 2
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.RLock()
+
+class _ThreadConnections(dict):
+    """One thread's connections by database path, dropped with the thread's threading.local when it exits."""
+
+def _discard_connection(conn):
+    # Finalizer of a _ThreadConnections, so pool threads don't keep their connection open after they exit
+    with _connections_lock:
+        _connections[:] = [entry for entry in _connections if entry[2] is not conn]
+    conn.close()
+
+def get_connection(db_file='itch.db'):
+    """
+    Return this thread's connection to db_file, opening it with the tuned PRAGMAs on first use.
+    Helpers share it instead of connecting per call, and sqlite3 reuses its prepared statements.
+    The connection is closed when the thread exits.
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = _ThreadConnections()
+    path = os.path.abspath(db_file)
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(db_file, timeout=30, cached_statements=CACHED_STATEMENTS, check_same_thread=False)
+        for pragma, value in CONNECTION_PRAGMAS.items():
+            conn.execute(f'PRAGMA {pragma} = {value}')
+        connections[path] = conn
+        with _connections_lock:
+            _connections.append((weakref.ref(connections), path, conn))
+        weakref.finalize(connections, _discard_connection, conn)
+    return conn
+
+def close_connections(db_file=None):
+    """Close the shared connections of every thread, to db_file only if given (e.g. before deleting it)."""
+    path = os.path.abspath(db_file) if db_file else None
+    with _connections_lock:
+        closing = [entry for entry in _connections if path is None or entry[1] == path]
+        _connections[:] = [entry for entry in _connections if not (path is None or entry[1] == path)]
+    for connections_ref, entry_path, conn in closing:
+        conn.close()
+        connections = connections_ref()
+        if connections is not None:
+            connections.pop(entry_path, None)
+
+# Comma-joined Game columns normalised into a lookup table and a link table each, e.g. Tag and GameTag
+FACETS = {'Tags': 'Tag', 'Genre': 'Genre', 'Platforms': 'Platform', 'Inputs': 'Input', 'Languages': 'Language'}
+
+def game_values(game_data):
+    return tuple(game_data[column] for column in GAME_COLUMNS[:GAME_COLUMNS.index('Stars')]) + \
+           tuple(game_info_value(game_data, column) for column in GAME_INFO_COLUMNS)
+
+def game_info_value(game_info, column):
+    """Missing numbers and dates are stored as NULL, missing text as ''."""
+    return game_info.get(column, None if column in TYPED_COLUMNS else '')
+
+def game_table_sql(table_name):
+    columns = ',\n'.join(f"                    {column} {TYPED_COLUMNS.get(column, 'TEXT')}" for column in GAME_COLUMNS)
+    return f'''CREATE TABLE IF NOT EXISTS {table_name} (
+                    id INTEGER PRIMARY KEY,
+{columns}
+                )'''
+
+def migrate_text_columns(cursor, table_name='Game'):
+    """Rebuild a Game table created with the old all-TEXT schema, parsing ratings, counts and dates in place."""
+    from game_page_info import parse_number, parse_date
+
+    log.info("Migrating table '%s' to typed columns...", table_name)
+    cursor.execute(game_table_sql(f'{table_name}_typed'))
+    rows = cursor.execute(f"SELECT id, {', '.join(GAME_COLUMNS)} FROM {table_name}").fetchall()
+    converted = []
+    for row in rows:
+        game = dict(zip(['id'] + GAME_COLUMNS, row))
+        game['FileCount'] = parse_number(game['FileCount'], int, 0)
+        game['Stars'] = parse_number(game['Stars'], float)
+        game['RatingCount'] = parse_number(game['RatingCount'], int)
+        for column in ('Updated', 'Published', 'ReleaseDate'):
+            game[column] = parse_date(game[column])
+        converted.append([game['id']] + [game[column] for column in GAME_COLUMNS])
+    cursor.executemany(f"INSERT INTO {table_name}_typed (id, {', '.join(GAME_COLUMNS)}) VALUES ({', '.join('?' for _ in range(len(GAME_COLUMNS) + 1))})",
+                       converted)
+    cursor.execute(f'DROP TABLE {table_name}')
+    cursor.execute(f'ALTER TABLE {table_name}_typed RENAME TO {table_name}')
+    log.info("Migrated %s games to typed columns.", len(converted))
+
+def split_facet(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+def create_facet_tables(cursor, table_name='Game'):
+    for facet in FACETS.values():
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS {facet} (id INTEGER PRIMARY KEY, Name TEXT COLLATE NOCASE UNIQUE)')
+        # Keyed by facet first, so every filter is an index range and filters combine with INTERSECT/EXCEPT
+        cursor.execute(f'''CREATE TABLE IF NOT EXISTS {table_name}{facet} (
+                        {facet}Id INTEGER REFERENCES {facet} (id),
+                        GameId INTEGER REFERENCES {table_name} (id),
+                        PRIMARY KEY ({facet}Id, GameId)
+                    ) WITHOUT ROWID''')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}{facet}_game ON {table_name}{facet} (GameId)')
+
+def link_facets(cursor, games, table_name='Game', replace=False):
+    """
+    Link (game_id, game_data) pairs to their tags, genres, platforms, inputs and languages.
+    Only the facet columns present in game_data are touched, with `replace` their old links are dropped first.
+    """
+    for column, facet in FACETS.items():
+        present = [(game_id, game_data) for game_id, game_data in games if column in game_data]
+        if replace:
+            cursor.executemany(f'DELETE FROM {table_name}{facet} WHERE GameId = ?', [(game_id,) for game_id, _ in present])
+        pairs = [(game_id, name) for game_id, game_data in present for name in split_facet(game_data[column])]
+        cursor.executemany(f'INSERT OR IGNORE INTO {facet} (Name) VALUES (?)', [(name,) for _, name in pairs])
+        cursor.executemany(f'''INSERT OR IGNORE INTO {table_name}{facet} ({facet}Id, GameId)
+                              SELECT id, ? FROM {facet} WHERE Name = ?''', pairs)
+
+def backfill_facets(cursor, table_name='Game'):
+    """Fill the facet tables from the comma-joined columns of games stored before they existed."""
+    if any(cursor.execute(f'SELECT 1 FROM {table_name}{facet} LIMIT 1').fetchone() for facet in FACETS.values()):
+        return
+    rows = cursor.execute(f"SELECT id, {', '.join(FACETS)} FROM {table_name}").fetchall()
+    if rows:
+        log.info("Linking %s existing games to their tags, genres, platforms, inputs and languages...", len(rows))
+        link_facets(cursor, [(row[0], dict(zip(FACETS, row[1:]))) for row in rows], table_name)
+
+# Columns of the full-text index, weighted in this order when ranking search results
+SEARCH_COLUMNS = ['Title', 'Developer', 'Description', 'Tags', 'Genre']
+
+def create_search_index(cursor, table_name='Game', rebuild=False):
+    """
+    Create the FTS5 index over the searchable columns, kept in sync with the Game table by triggers,
+    so every insert, info update and delete goes through it. Returns False if SQLite lacks FTS5.
+    """
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (f'{table_name}Search',)).fetchone()
+    try:
+        cursor.execute(f'''CREATE VIRTUAL TABLE IF NOT EXISTS {table_name}Search USING fts5(
+                        {', '.join(SEARCH_COLUMNS)},
+                        content='{table_name}', content_rowid='id',
+                        tokenize='unicode61 remove_diacritics 2', prefix='2 3')''')
+    except sqlite3.OperationalError as e:
+        log.warning("Full-text search is not available in this SQLite build: %s", e)
+        return False
+
+    columns = ', '.join(SEARCH_COLUMNS)
+    new_values = ', '.join(f'new.{column}' for column in SEARCH_COLUMNS)
+    old_values = ', '.join(f'old.{column}' for column in SEARCH_COLUMNS)
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS {table_name}_search_insert AFTER INSERT ON {table_name} BEGIN
+                        INSERT INTO {table_name}Search (rowid, {columns}) VALUES (new.id, {new_values});
+                    END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS {table_name}_search_delete AFTER DELETE ON {table_name} BEGIN
+                        INSERT INTO {table_name}Search ({table_name}Search, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+                    END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS {table_name}_search_update AFTER UPDATE ON {table_name} BEGIN
+                        INSERT INTO {table_name}Search ({table_name}Search, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+                        INSERT INTO {table_name}Search (rowid, {columns}) VALUES (new.id, {new_values});
+                    END''')
+    if rebuild or not exists:
+        log.info("Building the full-text index of table '%s'...", table_name)
+        cursor.execute(f"INSERT INTO {table_name}Search ({table_name}Search) VALUES ('rebuild')")
+    return True
+
+def title_trigrams(title):
+    """Lower-cased character trigrams of a title, with words padded so their start and end count too."""
+    normalized = ' '.join(re.sub(r'[^\w\s]', ' ', (title or '').lower()).split())
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def index_titles(cursor, games, table_name='Game'):
+    """Add (game_id, title) pairs to the trigram index used for fuzzy title lookups."""
+    cursor.executemany(f'INSERT OR IGNORE INTO {table_name}TitleTrigram (Trigram, GameId) VALUES (?, ?)',
+                       [(trigram, game_id) for game_id, title in games for trigram in title_trigrams(title)])
+
+def create_title_index(cursor, table_name='Game'):
+    # Exact lookups ignoring case use this index instead of scanning LOWER(Title)
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_title_nocase ON {table_name} (Title COLLATE NOCASE)')
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS {table_name}TitleTrigram (
+                    Trigram TEXT,
+                    GameId INTEGER REFERENCES {table_name} (id),
+                    PRIMARY KEY (Trigram, GameId)
+                ) WITHOUT ROWID''')
+    if not cursor.execute(f'SELECT 1 FROM {table_name}TitleTrigram LIMIT 1').fetchone():
+        rows = cursor.execute(f'SELECT id, Title FROM {table_name}').fetchall()
+        if rows:
+            log.info("Indexing the trigrams of %s existing titles...", len(rows))
+            index_titles(cursor, rows, table_name)
+
 def create_db(db_file='itch.db', table_name='Game'):
-    log.info(f"Creating database and table '{table_name}' if they don't exist...")
-    conn = sqlite3.connect(db_file)
+    log.info("Creating database and table '%s' if they don't exist...", table_name)
+    conn = get_connection(db_file)
+    # WAL lets readers query the database while a crawl is writing to it
+    conn.execute('PRAGMA journal_mode=WAL')
     cursor = conn.cursor()
-    cursor.execute(f'''CREATE TABLE IF NOT EXISTS {table_name} (
+    cursor.execute(game_table_sql(table_name))
+    column_types = {name: column_type for _, name, column_type, _, _, _ in cursor.execute(f'PRAGMA table_info({table_name})')}
+    migrated = column_types.get('Stars') == 'TEXT'
+    if migrated:
+        migrate_text_columns(cursor, table_name)
+    create_search_index(cursor, table_name, rebuild=migrated)
+    for column in INDEXED_COLUMNS:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_{column.lower()} ON {table_name} ({column})')
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table_name}_homepage ON {table_name} (HomePage)')
+    # A game bought in several bundles has one Game row and one membership row per bundle
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS Bundle{table_name} (
                     id INTEGER PRIMARY KEY,
-                    Title TEXT,
-                    Developer TEXT,
-                    ImageURL TEXT,
-                    HomePage TEXT,
+                    GameId INTEGER REFERENCES {table_name} (id),
+                    Bundle TEXT,
+                    BundleURL TEXT,
                     Key TEXT,
                     DLPage TEXT,
-                    FileCount TEXT,
-                    Platforms TEXT,
-                    Description TEXT,
                     Download TEXT,
-                    Stars TEXT,
-                    RatingCount TEXT,
-                    Author TEXT,
-                    Genre TEXT,
-                    AverageSession TEXT,
-                    Languages TEXT,
-                    Updated TEXT,
-                    Published TEXT,
-                    Status TEXT,
-                    Inputs TEXT,
-                    Accessibility TEXT,
-                    Tags TEXT,
-                    ReleaseDate TEXT,
-                    Other TEXT
+                    UNIQUE (GameId, BundleURL)
                 )''')
+    create_facet_tables(cursor, table_name)
+    backfill_facets(cursor, table_name)
+    create_title_index(cursor, table_name)
+    create_manifest_table(cursor, table_name)
+    create_queue_table(cursor, table_name)
+    create_crawl_state_table(cursor)
+    cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
     conn.commit()
-    conn.close()
     log.info("Database and table created.")
 
-def insert_game(game_data, db_file='itch.db', table_name='Game'):
-    log.info(f"Inserting game '{game_data['Title']}' into table '{table_name}'...")
-    conn = sqlite3.connect(db_file)
+def upgrade_db(db_file='itch.db', table_name='Game'):
+    """
+    Run create_db on an existing database built by an older version, so it gets the typed columns,
+    facet tables and search indexes the queries rely on. Only reads PRAGMA user_version once it is current.
+    """
+    if not os.path.exists(db_file):
+        return
+    conn = get_connection(db_file)
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version >= SCHEMA_VERSION or not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)).fetchone():
+        return
+    log.info("Upgrading database '%s' from schema version %s to %s...", db_file, version, SCHEMA_VERSION)
+    print("Upgrading the game database to the current schema, this only happens once...")
+    create_db(db_file, table_name)
+
+def write_games(cursor, entries, table_name='Game'):
+    """
+    Write (game_data, bundle) entries with one executemany per statement. A game whose HomePage is
+    already stored is not inserted again, its bundle only gets a membership row, and its claimed
+    download page replaces an unclaimed one. Returns the game ids of the entries.
+    """
+    placeholders = ', '.join('?' for _ in GAME_COLUMNS)
+    cursor.executemany(f'''INSERT INTO {table_name} ({', '.join(GAME_COLUMNS)})
+                          SELECT {placeholders}
+                          WHERE NOT EXISTS (SELECT 1 FROM {table_name} WHERE HomePage = ?)''',
+                       [game_values(game_data) + (game_data['HomePage'],) for game_data, _ in entries])
+    game_ids = [cursor.execute(f'SELECT id FROM {table_name} WHERE HomePage = ? ORDER BY id LIMIT 1', (game_data['HomePage'],)).fetchone()[0]
+                for game_data, _ in entries]
+    cursor.executemany(f'''INSERT OR IGNORE INTO Bundle{table_name} (GameId, Bundle, BundleURL, Key, DLPage, Download)
+                          VALUES (?, ?, ?, ?, ?, ?)''',
+                       [(game_id, bundle['name'], bundle['url'], game_data['Key'], game_data['DLPage'], game_data['Download'])
+                        for game_id, (game_data, bundle) in zip(game_ids, entries) if bundle])
+    cursor.executemany(f'''UPDATE {table_name} SET Key = ?, DLPage = ?, Download = ?
+                          WHERE id = ? AND COALESCE(DLPage, '') NOT LIKE 'http%' ''',
+                       [(game_data['Key'], game_data['DLPage'], game_data['Download'], game_id)
+                        for game_id, (game_data, _) in zip(game_ids, entries) if (game_data['DLPage'] or '').startswith('http')])
+    link_facets(cursor, [(game_id, game_data) for game_id, (game_data, _) in zip(game_ids, entries)], table_name)
+    index_titles(cursor, [(game_id, game_data['Title']) for game_id, (game_data, _) in zip(game_ids, entries)], table_name)
+    return game_ids
+
+def update_games_info(cursor, updates, table_name='Game'):
+    """Update the game page info panel columns of existing games from (game_id, game_info) pairs."""
+    assignments = ', '.join(f"{column} = ?" for column in GAME_INFO_COLUMNS)
+    cursor.executemany(f'UPDATE {table_name} SET {assignments} WHERE id = ?',
+                       [[game_info_value(game_info, column) for column in GAME_INFO_COLUMNS] + [game_id] for game_id, game_info in updates])
+    link_facets(cursor, updates, table_name, replace=True)
+
+def create_crawl_state_table(cursor):
+    # Checkpoints of the library crawl: bundle pages and game pages, so an interrupted crawl resumes where it stopped
+    cursor.execute('''CREATE TABLE IF NOT EXISTS CrawlState (
+                    Kind TEXT,
+                    URL TEXT,
+                    BundleURL TEXT,
+                    Bundle TEXT,
+                    Status TEXT,
+                    NextURL TEXT,
+                    PartialGame TEXT,
+                    Attempts INTEGER DEFAULT 0,
+                    UpdatedAt TEXT,
+                    PRIMARY KEY (Kind, URL, BundleURL)
+                )''')
+
+def record_crawl_state(cursor, checkpoints):
+    """
+    Write (kind, url, bundle, status, next_url, games) checkpoints. A page checkpoint also lists its
+    (game_page_url, partial_game) games as pending, so they can be finished without the page.
+    An item failing for the MAX_CRAWL_ATTEMPTS time is recorded as skipped instead of failed.
+    """
+    now = time.strftime('%Y-%m-%dT%H:%M:%S')
+    # Pending games first, a game finished in the same batch as its page then gets its status on top
+    cursor.executemany('''INSERT OR IGNORE INTO CrawlState (Kind, URL, BundleURL, Bundle, Status, PartialGame, UpdatedAt)
+                          VALUES ('game', ?, ?, ?, 'pending', ?, ?)''',
+                       [(game_page_url, bundle['url'], bundle['name'], json.dumps(partial_game), now)
+                        for _, _, bundle, _, _, games in checkpoints for game_page_url, partial_game in games])
+    cursor.executemany('''INSERT INTO CrawlState (Kind, URL, BundleURL, Bundle, Status, NextURL, Attempts, UpdatedAt)
+                          VALUES (?, ?, ?, ?, ?, ?, 1, ?)
+                          ON CONFLICT (Kind, URL, BundleURL) DO UPDATE SET
+                              Status = CASE WHEN excluded.Status = 'failed' AND Attempts + 1 >= ? THEN 'skipped' ELSE excluded.Status END,
+                              NextURL = excluded.NextURL, Attempts = Attempts + 1, UpdatedAt = excluded.UpdatedAt''',
+                       [(kind, url, bundle['url'], bundle['name'], status, next_url, now, MAX_CRAWL_ATTEMPTS)
+                        for kind, url, bundle, status, next_url, _ in checkpoints])
+
+def get_crawled_pages(db_file='itch.db'):
+    """
+    Map the (URL, BundleURL) of every bundle page crawled so far to the URL of the next page of its bundle.
+    A skipped page ends its bundle, it isn't fetched again.
+    """
+    conn = get_connection(db_file)
     cursor = conn.cursor()
+    cursor.execute("SELECT URL, BundleURL, NextURL FROM CrawlState WHERE Kind = 'page' AND Status IN ('done', 'skipped')")
+    return {(url, bundle_url): next_url for url, bundle_url, next_url in cursor.fetchall()}
+
+def get_unfinished_games(db_file='itch.db'):
+    """(game_page_url, bundle, partial_game) of the games left pending or failed by an earlier crawl."""
+    conn = get_connection(db_file)
+    cursor = conn.cursor()
+    cursor.execute("SELECT URL, BundleURL, Bundle, PartialGame FROM CrawlState WHERE Kind = 'game' AND Status IN ('pending', 'failed')")
+    return [(url, {'name': bundle, 'url': bundle_url}, json.loads(partial_game))
+            for url, bundle_url, bundle, partial_game in cursor.fetchall()]
+
+def get_crawl_status(db_file='itch.db'):
+    """Number of checkpointed pages and games per (kind, status)."""
+    conn = get_connection(db_file)
+    return dict(((kind, status), count) for kind, status, count in
+                conn.execute("SELECT Kind, Status, COUNT(*) FROM CrawlState WHERE Kind != 'crawl' GROUP BY Kind, Status"))
+
+def get_skipped_crawl_items(db_file='itch.db'):
+    """(kind, url, bundle name, attempts) of the pages and games given up on after MAX_CRAWL_ATTEMPTS."""
+    conn = get_connection(db_file)
+    return conn.execute("SELECT Kind, URL, Bundle, Attempts FROM CrawlState WHERE Status = 'skipped' ORDER BY Kind, URL").fetchall()
+
+def retry_skipped_crawl_items(db_file='itch.db'):
+    """Give the skipped pages and games new attempts, and reopen the crawl so the next run fetches them. Returns their number."""
+    conn = get_connection(db_file)
+    with conn:
+        retried = conn.execute("UPDATE CrawlState SET Status = 'failed', Attempts = 0 WHERE Status = 'skipped'").rowcount
+        if retried:
+            conn.execute("DELETE FROM CrawlState WHERE Kind = 'crawl'")
+    return retried
+
+def mark_crawl_complete(db_file='itch.db'):
+    conn = get_connection(db_file)
+    conn.execute('''INSERT OR REPLACE INTO CrawlState (Kind, URL, BundleURL, Status, UpdatedAt)
+                    VALUES ('crawl', 'bundles', '', 'done', ?)''', (time.strftime('%Y-%m-%dT%H:%M:%S'),))
+    conn.commit()
+
+def crawl_complete(db_file='itch.db'):
+    """
+    True once a full crawl finished with every page and game done or skipped. A database filled before
+    crawls were checkpointed has no state at all and counts as complete.
+    """
+    conn = get_connection(db_file)
+    try:
+        if conn.execute("SELECT 1 FROM CrawlState WHERE Kind = 'crawl' AND Status = 'done'").fetchone():
+            return True
+        return conn.execute('SELECT 1 FROM CrawlState LIMIT 1').fetchone() is None
+    except sqlite3.OperationalError:
+        return True
+
+def insert_game(game_data, db_file='itch.db', table_name='Game', bundle=None):
+    """
+    Insert a game unless a game with the same HomePage is already stored, and record which bundle it came from.
+    Returns the id of the game row.
+    """
+    log.info("Inserting game '%s' into table '%s'...", game_data['Title'], table_name)
+    conn = get_connection(db_file)
+    cursor = conn.cursor()
+    game_id = None
     try:
-        cursor.execute(f'''INSERT INTO {table_name} (
-                            Title, Developer, ImageURL, HomePage, Key, DLPage, FileCount, Platforms, Description, Download,
-                            Stars, RatingCount, Author, Genre, AverageSession, Languages, Updated, Published, Status,
-                            Inputs, Accessibility, Tags, ReleaseDate, Other)
-                          VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                          (game_data['Title'], game_data['Developer'], game_data['ImageURL'], game_data['HomePage'], game_data['Key'],
-                           game_data['DLPage'], game_data['FileCount'], game_data['Platforms'], game_data['Description'], game_data['Download'],
-                           game_data.get('Stars', ''), game_data.get('RatingCount', ''), game_data.get('Author', ''),
-                           game_data.get('Genre', ''), game_data.get('AverageSession', ''), game_data.get('Languages', ''),
-                           game_data.get('Updated', ''), game_data.get('Published', ''), game_data.get('Status', ''),
-                           game_data.get('Inputs', ''), game_data.get('Accessibility', ''), game_data.get('Tags', ''),
-                           game_data.get('ReleaseDate', ''), game_data.get('Other', '')))
+        # Look up and insert in one write transaction, so concurrent callers can't both insert the same game
+        cursor.execute('BEGIN IMMEDIATE')
+        game_id = write_games(cursor, [(game_data, bundle)], table_name)[0]
         conn.commit()
         log.info("Game data inserted successfully.")
     except sqlite3.Error as e:
-        log.error(f"Failed to insert game data: {e}")
-    finally:
-        conn.close()
+        conn.rollback()
+        log.error("Failed to insert game data: %s", e)
+    return game_id
+
+class GameWriter:
+    """
+    Single writer thread owning the only write connection of a crawl. Scrapers put games on its queue,
+    and it writes them with executemany, one transaction per `batch_size` rows or `flush_interval` seconds.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db_file='itch.db', table_name='Game', batch_size=200, flush_interval=1.0, max_queue=0):
+        self.db_file = db_file
+        self.table_name = table_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = threading.Thread(target=self._run, name='itchdb-writer', daemon=True)
+        self.written = 0
+        self.failed = 0
+        self.transactions = 0
+        self.error = None
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def put(self, game_data, bundle=None):
+        self.queue.put(('insert', (game_data, bundle)))
+
+    def put_update(self, game_id, game_info):
+        self.queue.put(('update', (game_id, game_info)))
+
+    def put_checkpoint(self, kind, url, bundle, status='done', next_url=None, games=()):
+        """Record crawl progress in the same transactions as the games queued before it."""
+        self.queue.put(('checkpoint', (kind, url, bundle, status, next_url, list(games))))
+
+    def close(self):
+        """
+        Flush everything queued so far and stop the writer thread. Returns the number of rows that could not be
+        written, rows queued after the writer thread died included, so callers can tell the crawl is incomplete.
+        """
+        self.queue.put(self._STOP)
+        self.thread.join()
+        log.info("Writer flushed %d rows in %d transactions, %d failed", self.written, self.transactions, self.failed)
+        if self.error is not None:
+            log.error("Writer thread died, %d rows were lost: %s", self.failed, self.error)
+        return self.failed
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _run(self):
+        batch = []
+        try:
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            deadline = None
+            stopping = False
+            while not stopping:
+                try:
+                    item = self.queue.get(timeout=max(0, deadline - time.monotonic()) if batch else None)
+                except queue.Empty:
+                    item = None
+                if item is self._STOP:
+                    stopping = True
+                elif item is not None:
+                    if not batch:
+                        deadline = time.monotonic() + self.flush_interval
+                    batch.append(item)
+                if batch and (stopping or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                    self._flush(conn, batch)
+                    batch = []
+            conn.close()
+        except Exception as e:
+            self.error = e
+            self.failed += len(batch)
+            log.error("Writer thread failed: %s", e)
+            # Keep draining so put() never blocks on a full queue, counting what is dropped
+            while self.queue.get() is not self._STOP:
+                self.failed += 1
+
+    def _write(self, conn, batch):
+        inserts = [args for kind, args in batch if kind == 'insert']
+        updates = [args for kind, args in batch if kind == 'update']
+        checkpoints = [args for kind, args in batch if kind == 'checkpoint']
+        with conn:
+            cursor = conn.cursor()
+            write_games(cursor, inserts, self.table_name)
+            update_games_info(cursor, updates, self.table_name)
+            record_crawl_state(cursor, checkpoints)
+        self.written += len(batch) - len(checkpoints)
+        self.transactions += 1
+        log.debug("Writer committed %d inserts, %d updates and %d checkpoints", len(inserts), len(updates), len(checkpoints))
+
+    def _flush(self, conn, batch):
+        try:
+            self._write(conn, batch)
+        except sqlite3.Error as e:
+            # Retry row by row, so one bad row doesn't take the games and checkpoints around it down with it
+            log.error("Failed to write a batch of %d rows, retrying them one by one: %s", len(batch), e)
+            for item in batch:
+                try:
+                    self._write(conn, [item])
+                except sqlite3.Error as e:
+                    self.failed += 1
+                    log.error("Failed to write %s %s: %s", item[0], item[1], e)
 
 def count_rows(db_file='itch.db', table_name='Game'):
-    conn = sqlite3.connect(db_file)
+    conn = get_connection(db_file)
     cursor = conn.cursor()
     cursor.execute(f'SELECT COUNT(*) FROM {table_name}')
     row_count = cursor.fetchone()[0]
-    conn.close()
-    log.info(f"Total number of rows in the {table_name} table: {row_count}")
+    log.info("Total number of rows in the %s table: %s", table_name, row_count)
     return row_count
 
 def get_game_by_title(title, db_file='itch.db', table_name='Game'):
-    conn = sqlite3.connect(db_file)
+    conn = get_connection(db_file)
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM {table_name} WHERE Title = ?', (title,))
+    cursor.execute(f'SELECT * FROM {table_name} WHERE Title = ? COLLATE NOCASE', (title,))
     game = cursor.fetchone()
-    conn.close()
     if game:
         log.info("Game found in database.")
         keys = ['id', 'Title', 'Developer', 'ImageURL', 'HomePage', 'Key', 'DLPage', 'FileCount', 'Platforms', 'Description', 'Download',
@@ -87,30 +539,229 @@ def get_game_by_title(title, db_file='itch.db', table_name='Game'):
         log.info("Game not found in database.")
         return None
 
+def get_known_games(db_file='itch.db', table_name='Game'):
+    """Map the HomePage of every game already in the database to its (id, Updated)."""
+    conn = get_connection(db_file)
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT HomePage, id, Updated FROM {table_name}')
+    known_games = {home_page: (game_id, updated) for home_page, game_id, updated in cursor.fetchall()}
+    log.info("%s games already known in table '%s'", len(known_games), table_name)
+    return known_games
+
+def get_known_memberships(db_file='itch.db', table_name='Game'):
+    """Set of (HomePage, BundleURL) pairs already recorded as bundle memberships."""
+    conn = get_connection(db_file)
+    cursor = conn.cursor()
+    cursor.execute(f'''SELECT g.HomePage, b.BundleURL FROM Bundle{table_name} b
+                       JOIN {table_name} g ON g.id = b.GameId''')
+    known_memberships = set(cursor.fetchall())
+    return known_memberships
+
+def update_game_info(game_id, game_info, db_file='itch.db', table_name='Game'):
+    """Update the game page info panel columns of an existing game in place."""
+    log.info("Updating game page info of game %s in table '%s'...", game_id, table_name)
+    conn = get_connection(db_file)
+    cursor = conn.cursor()
+    try:
+        update_games_info(cursor, [(game_id, game_info)], table_name)
+        conn.commit()
+        log.info("Game data updated successfully.")
+    except sqlite3.Error as e:
+        conn.rollback()
+        log.error("Failed to update game data: %s", e)
+
+def create_manifest_table(cursor, table_name='Game'):
+    # One row per downloaded upload, so files already on disk are not fetched again
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS DownloadManifest (
+                    UploadId INTEGER PRIMARY KEY,
+                    GameId INTEGER REFERENCES {table_name} (id),
+                    Path TEXT,
+                    Size INTEGER,
+                    ModifiedNs INTEGER,
+                    Checksum TEXT,
+                    ListedSize TEXT,
+                    DownloadedAt TEXT,
+                    UploadMarker TEXT
+                )''')
+    # Manifests created before uploads were tracked by their upload date and build
+    if 'UploadMarker' not in [row[1] for row in cursor.execute('PRAGMA table_info(DownloadManifest)')]:
+        cursor.execute('ALTER TABLE DownloadManifest ADD COLUMN UploadMarker TEXT')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_downloadmanifest_gameid ON DownloadManifest (GameId)')
+
+def ensure_download_manifest(db_file='itch.db', table_name='Game'):
+    conn = get_connection(db_file)
+    create_manifest_table(conn.cursor(), table_name)
+    conn.commit()
+
+def get_download(upload_id, db_file='itch.db'):
+    """Manifest entry of an upload as a dict, or None if it was never downloaded."""
+    conn = get_connection(db_file)
+    cursor = conn.cursor()
+    cursor.execute('''SELECT UploadId, GameId, Path, Size, ModifiedNs, Checksum, ListedSize, DownloadedAt, UploadMarker
+                      FROM DownloadManifest WHERE UploadId = ?''', (int(upload_id),))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip([column[0] for column in cursor.description], row))
+
+def record_download(upload_id, game_id, path, checksum, listed_size, upload_marker=None, db_file='itch.db'):
+    """Add or replace the manifest entry of a finished download, with the size and mtime it has on disk."""
+    stat = os.stat(path)
+    conn = get_connection(db_file)
+    try:
+        conn.execute('''INSERT OR REPLACE INTO DownloadManifest
+                        (UploadId, GameId, Path, Size, ModifiedNs, Checksum, ListedSize, DownloadedAt, UploadMarker)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                     (int(upload_id), game_id, os.path.abspath(path), stat.st_size, stat.st_mtime_ns, checksum, listed_size,
+                      time.strftime('%Y-%m-%dT%H:%M:%S'), upload_marker))
+        conn.commit()
+        log.info("Recorded upload %s (%s bytes, sha256 %s) in the download manifest", upload_id, stat.st_size, checksum)
+    except sqlite3.Error as e:
+        conn.rollback()
+        log.error("Failed to record upload %s in the download manifest: %s", upload_id, e)
+
+def update_download(upload_id, modified_ns=None, upload_marker=None, db_file='itch.db'):
+    """Refresh the mtime of a manifest entry whose file was verified by checksum, or fill in its missing upload marker."""
+    conn = get_connection(db_file)
+    with conn:
+        conn.execute('''UPDATE DownloadManifest SET ModifiedNs = COALESCE(?, ModifiedNs), UploadMarker = COALESCE(?, UploadMarker)
+                        WHERE UploadId = ?''', (modified_ns, upload_marker, int(upload_id)))
+
+def create_queue_table(cursor, table_name='Game'):
+    # Games waiting to be downloaded, a row stays 'running' only while a scheduler works on it
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS DownloadQueue (
+                    id INTEGER PRIMARY KEY,
+                    GameId INTEGER UNIQUE REFERENCES {table_name} (id),
+                    Priority INTEGER DEFAULT 0,
+                    Status TEXT DEFAULT 'pending',
+                    Attempts INTEGER DEFAULT 0,
+                    DestFolder TEXT,
+                    Error TEXT,
+                    UpdatedAt TEXT
+                )''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_downloadqueue_next ON DownloadQueue (Status, Priority DESC, id)')
+
+def ensure_download_queue(db_file='itch.db', table_name='Game'):
+    conn = get_connection(db_file)
+    create_queue_table(conn.cursor(), table_name)
+    conn.commit()
+
+def enqueue_downloads(game_ids, dest_folder, priority=0, db_file='itch.db'):
+    """
+    Queue games for download. A game already queued gets the new priority and folder and is
+    retried if it finished or failed, unless a scheduler is downloading it right now. Returns the number queued.
+    """
+    now = time.strftime('%Y-%m-%dT%H:%M:%S')
+    conn = get_connection(db_file)
+    cursor = conn.cursor()
+    cursor.executemany('''INSERT INTO DownloadQueue (GameId, Priority, Status, DestFolder, UpdatedAt)
+                          VALUES (?, ?, 'pending', ?, ?)
+                          ON CONFLICT (GameId) DO UPDATE SET Priority = excluded.Priority, DestFolder = excluded.DestFolder,
+                              Status = 'pending', Attempts = 0, Error = NULL, UpdatedAt = excluded.UpdatedAt
+                          WHERE Status IN ('pending', 'done', 'failed')''',
+                       [(game_id, priority, dest_folder, now) for game_id in dict.fromkeys(game_ids)])
+    conn.commit()
+    log.info("Queued %s games for download to '%s' with priority %s", cursor.rowcount, dest_folder, priority)
+    return cursor.rowcount
+
+def claim_download(db_file='itch.db'):
+    """Mark the most urgent pending download as running and return its (id, GameId, DestFolder, Attempts), or None."""
+    conn = get_connection(db_file)
+    cursor = conn.cursor()
+    try:
+        # Claimed in one write transaction, so two workers never pick the same entry
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute("SELECT id, GameId, DestFolder, Attempts FROM DownloadQueue WHERE Status = 'pending' ORDER BY Priority DESC, id LIMIT 1")
+        entry = cursor.fetchone()
+        if entry:
+            cursor.execute("UPDATE DownloadQueue SET Status = 'running', Attempts = Attempts + 1, UpdatedAt = ? WHERE id = ?",
+                           (time.strftime('%Y-%m-%dT%H:%M:%S'), entry[0]))
+            entry = entry[:3] + (entry[3] + 1,)
+        conn.commit()
+        return entry
+    except sqlite3.Error as e:
+        conn.rollback()
+        log.error("Failed to claim a queued download: %s", e)
+        return None
+
+def finish_download(queue_id, status, error=None, db_file='itch.db'):
+    conn = get_connection(db_file)
+    conn.execute('UPDATE DownloadQueue SET Status = ?, Error = ?, UpdatedAt = ? WHERE id = ?',
+                 (status, error, time.strftime('%Y-%m-%dT%H:%M:%S'), queue_id))
+    conn.commit()
+
+def reset_interrupted_downloads(db_file='itch.db'):
+    """Put entries left 'running' by a scheduler that crashed or was stopped back in the queue."""
+    conn = get_connection(db_file)
+    reset = conn.execute("UPDATE DownloadQueue SET Status = 'pending' WHERE Status = 'running'").rowcount
+    conn.commit()
+    if reset:
+        log.info("Requeued %s interrupted downloads", reset)
+    return reset
+
+def retry_failed_downloads(db_file='itch.db'):
+    conn = get_connection(db_file)
+    retried = conn.execute("UPDATE DownloadQueue SET Status = 'pending', Attempts = 0 WHERE Status = 'failed'").rowcount
+    conn.commit()
+    return retried
+
+def get_queue_status(db_file='itch.db'):
+    """Number of queued downloads per status."""
+    conn = get_connection(db_file)
+    return dict(conn.execute('SELECT Status, COUNT(*) FROM DownloadQueue GROUP BY Status').fetchall())
+
+def get_download_page(game_id, db_file='itch.db', table_name='Game'):
+    """(Title, DLPage, Key) of a game, taking a claimed download page from its bundles if its own is unclaimed."""
+    conn = get_connection(db_file)
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT Title, DLPage, Key FROM {table_name} WHERE id = ?', (game_id,))
+    game = cursor.fetchone()
+    if game and not (game[1] or '').startswith('http'):
+        cursor.execute(f"SELECT DLPage, Key FROM Bundle{table_name} WHERE GameId = ? AND DLPage LIKE 'http%' LIMIT 1", (game_id,))
+        bundle_page = cursor.fetchone()
+        if bundle_page:
+            game = (game[0],) + bundle_page
+    return game
+
+def get_game_id_by_dl_page(dl_page, db_file='itch.db', table_name='Game'):
+    """id of the game whose download page (own or from a bundle) is dl_page, or None."""
+    conn = get_connection(db_file)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f'''SELECT id FROM {table_name} WHERE DLPage = ?
+                           UNION ALL SELECT GameId FROM Bundle{table_name} WHERE DLPage = ? LIMIT 1''', (dl_page, dl_page))
+    except sqlite3.Error as e:
+        log.warning("Could not look up the game of %s: %s", dl_page, e)
+        return None
+    row = cursor.fetchone()
+    return row[0] if row else None
+
 def db_file_exists(db_file='itch.db'):
     exists = os.path.isfile(db_file)
-    log.info(f"Database file '{db_file}' exists: {exists}")
+    log.info("Database file '%s' exists: %s", db_file, exists)
     return exists
 
 def table_exists(db_file='itch.db', table_name='Game'):
-    log.info(f"Checking if table '{table_name}' exists in database '{db_file}'...")
-    conn = sqlite3.connect(db_file)
+    log.info("Checking if table '%s' exists in database '%s'...", table_name, db_file)
+    conn = get_connection(db_file)
     c = conn.cursor()
     c.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
     table_exists = c.fetchone() is not None
-    conn.close()
-    log.info(f"Table '{table_name}' exists: {table_exists}")
+    log.info("Table '%s' exists: %s", table_name, table_exists)
     return table_exists
 
 def clean_database(db_file='itch.db', table_name='Game'):
     if db_file_exists(db_file):
         row_count = count_rows(db_file, table_name)
         print(f"Database '{db_file}' exists with {row_count} rows in table '{table_name}'. Deleting database.")
-        os.remove(db_file)
-        log.info(f"Database '{db_file}' deleted successfully.")
+        close_connections(db_file)
+        for path in (db_file, f"{db_file}-wal", f"{db_file}-shm"):
+            if os.path.exists(path):
+                os.remove(path)
+        log.info("Database '%s' deleted successfully.", db_file)
     else:
         print(f"Database '{db_file}' does not exist.")
-        log.warning(f"No database file '{db_file}' to delete.")
+        log.warning("No database file '%s' to delete.", db_file)
 
 def main():
     parser = argparse.ArgumentParser(description="Manage the itch.io game database.")
@@ -129,7 +780,8 @@ def main():
     else:
         if not db_file_exists(db_file) or not table_exists(db_file, table_name):
             clean_database(db_file, table_name)
-            create_db(db_file, table_name)
+        # Creates a missing database, and upgrades an existing one in place
+        create_db(db_file, table_name)
 
 if __name__ == "__main__":
     main()
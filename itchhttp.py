@@ -0,0 +1,209 @@
+import time
+import threading
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+import itchcache
+import itchylog as log
+
+# Number of per-host connection pools kept alive (itch.io, the developer subdomains, the CDN...)
+POOL_CONNECTIONS = 32
+# Number of keep-alive connections kept per host, should cover the crawl/download workers
+POOL_MAXSIZE = 32
+
+# Requests per second across every scraper and downloader thread of the process to start at, and the burst above it
+RATE = 8.0
+BURST = 8
+# Hard ceiling the rate climbs towards while itch.io keeps answering without throttling
+MAX_RATE = 32.0
+# Requests in flight at most, the adaptive limit moves between these bounds
+MIN_CONCURRENCY = 1
+MAX_CONCURRENCY = 16
+# Responses that mean itch.io wants us to slow down, they are retried after Retry-After or a growing backoff
+THROTTLE_STATUSES = (429, 503)
+MAX_THROTTLE_RETRIES = 5
+MAX_BACKOFF_SECONDS = 60
+
+_session = None
+_session_lock = threading.Lock()
+
+class RateLimiter:
+    """
+    Token bucket shared by the whole process, with an adaptive rate and concurrency limit. Only a throttling
+    response lowers them: it halves both and pauses every request until Retry-After. Each run of healthy
+    responses as long as the concurrency limit raises them one step, past the starting rate up to max_rate,
+    so a crawl settles just under the fastest rate itch.io allows.
+    """
+    def __init__(self, rate=RATE, burst=BURST, max_concurrency=MAX_CONCURRENCY, max_rate=MAX_RATE):
+        self.condition = threading.Condition()
+        self.rate = rate
+        self.max_rate = max(rate, max_rate)
+        self.min_rate = rate / 16
+        self.rate_step = rate / 8
+        self.burst = self.tokens = burst
+        self.max_concurrency = self.concurrency = max_concurrency
+        self.active = 0
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.healthy = 0
+        self.throttled = 0
+
+    def acquire(self):
+        """Wait for a token and a free concurrency slot."""
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                if now > self.updated:
+                    self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                if now < self.paused_until:
+                    self.condition.wait(self.paused_until - now)
+                elif self.tokens < 1:
+                    self.condition.wait((1 - self.tokens) / self.rate)
+                elif self.active >= self.concurrency:
+                    self.condition.wait()
+                else:
+                    self.tokens -= 1
+                    self.active += 1
+                    return
+
+    def release(self, status_code=None, retry_after=None):
+        """Free the slot and adapt to the response, status_code is None when the request failed without one."""
+        with self.condition:
+            self.active -= 1
+            if status_code in THROTTLE_STATUSES:
+                self.healthy = 0
+                # Requests sent before the pause began come back throttled too, they only extend the pause
+                if time.monotonic() >= self.paused_until:
+                    self.throttled += 1
+                    self.rate = max(self.min_rate, self.rate / 2)
+                    self.concurrency = max(MIN_CONCURRENCY, self.concurrency // 2)
+                pause = retry_after if retry_after is not None else min(2 ** self.throttled, MAX_BACKOFF_SECONDS)
+                self.paused_until = max(self.paused_until, time.monotonic() + pause)
+                # No burst when the pause ends, tokens only start refilling from then
+                self.tokens = 0
+                self.updated = self.paused_until
+                log.warning("Throttled with %s, pausing %.0fs at %.2f requests/s and %s in flight", status_code, pause, self.rate, self.concurrency)
+            elif status_code is not None and status_code < 500:
+                self.throttled = 0
+                self.healthy += 1
+                if self.healthy >= self.concurrency and (self.rate < self.max_rate or self.concurrency < self.max_concurrency):
+                    self.healthy = 0
+                    self.rate = min(self.max_rate, self.rate + self.rate_step)
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+                    log.debug("Responses healthy, raising to %.2f requests/s and %d in flight", self.rate, self.concurrency)
+            self.condition.notify_all()
+
+_limiter = RateLimiter()
+
+def configure_rate(rate=RATE, burst=BURST, max_concurrency=MAX_CONCURRENCY, max_rate=MAX_RATE):
+    """Replace the process-wide limiter, e.g. from the --rate and --max-rate command line options."""
+    global _limiter
+    _limiter = RateLimiter(rate, burst, max_concurrency, max_rate)
+    log.info("Rate limited to %s requests/s rising up to %s, bursts of %d and %d in flight", rate, _limiter.max_rate, burst, max_concurrency)
+
+def retry_after_seconds(value):
+    """Seconds to wait from a Retry-After header, given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return int(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+def create_session(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE):
+    """Create a session with the stored credential headers and cookies, and sized connection pools."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    # Credentials are decrypted when the first request is made, not when this module is imported
+    from cred_store import fetch_credentials, fetch_cookie_jar
+    credentials = fetch_credentials()
+    if credentials:
+        session.headers.update(credentials)
+        session.cookies.update(fetch_cookie_jar())
+    else:
+        log.warning("No stored credentials, requests will be sent anonymously")
+    log.info("HTTP session created with %s host pools of %s connections", pool_connections, pool_maxsize)
+    return session
+
+def get_session():
+    """Return the process-wide session, creating it on first use. Safe to call from worker threads."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+def reset_session():
+    """Close the shared session, the next request opens a new one (e.g. after logging in again)."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+def configure_pools(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE):
+    """Resize the connection pools of the shared session, e.g. to match a crawl's worker count."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = create_session(pool_connections, pool_maxsize)
+
+def request(method, url, **kwargs):
+    """
+    Send a request through the process-wide rate limiter. Throttling responses are retried once the
+    limiter lets requests through again, the last one is returned if they keep coming.
+    """
+    for attempt in range(MAX_THROTTLE_RETRIES + 1):
+        limiter = _limiter
+        limiter.acquire()
+        status_code = retry_after = None
+        try:
+            response = get_session().request(method, url, **kwargs)
+            status_code = response.status_code
+            retry_after = retry_after_seconds(response.headers.get('Retry-After'))
+        finally:
+            # Only the request counts against the limits, a streamed body is read after the slot is freed
+            limiter.release(status_code, retry_after)
+        if status_code not in THROTTLE_STATUSES or attempt == MAX_THROTTLE_RETRIES:
+            return response
+        log.warning("%s from %s, retrying (%s/%s)", status_code, url, attempt + 1, MAX_THROTTLE_RETRIES)
+        response.close()
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+def get_cached(url, headers=None, **kwargs):
+    """
+    GET through the on-disk cache: a cached page is revalidated with If-None-Match/If-Modified-Since,
+    and on a 304 its stored body is returned as a 200 response with `from_cache` set.
+    """
+    entry = itchcache.lookup(url)
+    request_headers = dict(headers or {})
+    request_headers.update(itchcache.conditional_headers(entry))
+    response = get(url, headers=request_headers, **kwargs)
+    response.from_cache = False
+
+    if response.status_code == 304 and entry:
+        log.debug("Not modified, serving %s from cache", url)
+        itchcache.touch(url)
+        response.status_code = 200
+        response._content = entry[2]
+        response.from_cache = True
+    elif response.status_code == 200:
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        # Pages without validators can't be revalidated, so there is no point in keeping them
+        if etag or last_modified:
+            itchcache.store(url, etag, last_modified, response.content)
+    return response
@@ -0,0 +1,119 @@
+import os
+import re
+import sqlite3
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import itchdb
+import get_downloads
+import itchylog as log
+
+# A game that fails this many times is marked failed instead of going back to the queue
+MAX_ATTEMPTS = 3
+
+def game_folder(dest_folder, title):
+    """Each queued game gets its own folder, so files with the same name from different games don't clash."""
+    return os.path.join(dest_folder, re.sub(r'[\\/:*?"<>|]', '_', title or '').strip(' .') or 'Untitled')
+
+def enqueue(games, dest_folder, priority=0, db_file='itch.db'):
+    """Queue query results for download, the first column of each row being the game id (as in SELECT * FROM Game)."""
+    itchdb.ensure_download_queue(db_file)
+    return itchdb.enqueue_downloads([game[0] for game in games], dest_folder, priority, db_file)
+
+def process_entry(entry, file_workers=4, segments=1, max_attempts=MAX_ATTEMPTS, db_file='itch.db', buffer_size=None):
+    """Download every file of one queued game and record the outcome. Returns True if it finished."""
+    queue_id, game_id, dest_folder, attempts = entry
+    game = itchdb.get_download_page(game_id, db_file)
+    if game is None or not (game[1] or '').startswith('http'):
+        log.warning("Game %s has no claimed download page, dropping it from the queue", game_id)
+        itchdb.finish_download(queue_id, 'failed', 'No claimed download page', db_file)
+        return False
+
+    title, dl_page, key = game
+    print(f"Downloading '{title}' (attempt {attempts}/{max_attempts})")
+    try:
+        failed = get_downloads.download_game(dl_page, game_folder(dest_folder, title), key, game_id, file_workers, segments,
+                                              buffer_size=buffer_size)
+        error = 'Download page could not be read' if failed is None else (f"Failed files: {', '.join(failed)}" if failed else None)
+    except Exception as e:
+        log.error("Downloading '%s' failed: %s", title, e)
+        error = str(e)
+
+    if error is None:
+        itchdb.finish_download(queue_id, 'done', None, db_file)
+        print(f"Finished '{title}'")
+        return True
+    status = 'failed' if attempts >= max_attempts else 'pending'
+    itchdb.finish_download(queue_id, status, error, db_file)
+    print(f"'{title}' {'failed' if status == 'failed' else 'will be retried'}: {error}")
+    return False
+
+def worker(file_workers, segments, max_attempts, db_file, buffer_size=None):
+    finished = 0
+    while True:
+        entry = itchdb.claim_download(db_file)
+        if entry is None:
+            return finished
+        finished += process_entry(entry, file_workers, segments, max_attempts, db_file, buffer_size)
+
+def run_queue(workers=2, file_workers=4, segments=1, max_attempts=MAX_ATTEMPTS, db_file='itch.db', buffer_size=None):
+    """
+    Drain the download queue with `workers` games downloading at once, highest priority first.
+    The queue lives in the database, so a run that crashes or is stopped carries on where it left off.
+    """
+    itchdb.ensure_download_queue(db_file)
+    itchdb.reset_interrupted_downloads(db_file)
+    status = itchdb.get_queue_status(db_file)
+    print(f"{status.get('pending', 0)} games waiting for download")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(worker, file_workers, segments, max_attempts, db_file, buffer_size) for _ in range(workers)]
+        finished = sum(future.result() for future in futures)
+    print(f"Downloaded {finished} games.")
+    print_status(db_file)
+    return finished
+
+def print_status(db_file='itch.db'):
+    itchdb.ensure_download_queue(db_file)
+    status = itchdb.get_queue_status(db_file)
+    print(', '.join(f"{status.get(state, 0)} {state}" for state in ('pending', 'running', 'done', 'failed')))
+    conn = itchdb.get_connection(db_file)
+    for title, error in conn.execute('''SELECT g.Title, q.Error FROM DownloadQueue q JOIN Game g ON g.id = q.GameId
+                                        WHERE q.Status = 'failed' ORDER BY q.UpdatedAt'''):
+        print(f"  failed: {title}: {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue games for download and download them in the background.")
+    parser.add_argument('--sql', help="Queue the games returned by a query, its first column being the game id.")
+    parser.add_argument('--dir', help="The directory the queued games are downloaded to, one folder per game.")
+    parser.add_argument('--priority', type=int, default=0, help="Higher priorities are downloaded first.")
+    parser.add_argument('--run', action='store_true', help="Download everything in the queue.")
+    parser.add_argument('--workers', type=int, default=2, help="Number of games downloaded at once.")
+    parser.add_argument('--file-workers', type=int, default=4, help="Number of files of a game downloaded at once.")
+    parser.add_argument('--segments', type=int, default=1, help="Split large files into this many parallel byte ranges.")
+    parser.add_argument('--buffer-mib', type=int, default=1, help="Size in MiB of the buffer each download stream is read into.")
+    parser.add_argument('--retry-failed', action='store_true', help="Put failed downloads back in the queue.")
+    parser.add_argument('--status', action='store_true', help="Show the state of the queue.")
+
+    parser.add_argument('--log-level', help="Level of the log written to out/ (DEBUG, INFO, WARNING...), DEBUG by default.")
+    args = parser.parse_args()
+    if args.log_level:
+        log.set_level(args.log_level)
+    itchdb.upgrade_db()
+
+    if args.sql:
+        if not args.dir:
+            parser.error("--sql needs --dir")
+        try:
+            print(f"Queued {enqueue(itchdb.get_connection().execute(args.sql).fetchall(), args.dir, args.priority)} games.")
+        except sqlite3.Error as e:
+            log.error("Database error while queueing games: %s", e)
+            print(f"Database error: {e}")
+    if args.retry_failed:
+        itchdb.ensure_download_queue()
+        print(f"Requeued {itchdb.retry_failed_downloads()} failed downloads.")
+    if args.run:
+        run_queue(args.workers, args.file_workers, args.segments, buffer_size=args.buffer_mib * 1024 * 1024)
+    elif args.status or not (args.sql or args.retry_failed):
+        print_status()
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,112 @@
 # itchylog.py
 import os
-import logging
+import threading
 import time
 
-# Create the out folder if it doesn't exist
-if not os.path.exists('out'):
-    os.makedirs('out')
+# Set the debug_mode to False to disable debug logs, ITCHYLOG_LEVEL (e.g. WARNING) overrides it
+debug_mode = True
+# The log file rolls over to scratch-<ts>.log.1, .2... once it reaches this size
+MAX_LOG_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 5
 
-# Create the filename with the current epoch timestamp and specify the path to the out folder
-log_filename = os.path.join('out', f"scratch-{int(time.time())}.log")
+# The log file is only created on the first log call, importing this module has no side effects
+log_filename = None
+logger = None
+_listener = None
+_configure_lock = threading.Lock()
 
-# Set the debug_mode to False to disable debug logs
-debug_mode = True
+def deferred_queue_handler():
+    """QueueHandler that leaves the %-formatting of the message to the listener thread."""
+    from logging.handlers import QueueHandler
+
+    class DeferredQueueHandler(QueueHandler):
+        # The record stays in this process, so its arguments don't need to be rendered before queueing
+        # (they must not be mutated after the log call, which holds for the headers and rows logged here)
+        def prepare(self, record):
+            return record
+
+    return DeferredQueueHandler
+
+def default_level():
+    """Level from ITCHYLOG_LEVEL, or from debug_mode when it is unset or not a level name."""
+    import logging
+    fallback = 'DEBUG' if debug_mode else 'INFO'
+    level = os.environ.get('ITCHYLOG_LEVEL', '').upper()
+    if not level:
+        return fallback
+    if not isinstance(logging.getLevelName(level), int):
+        print(f"Warning: ignoring ITCHYLOG_LEVEL={level}, it is not a log level (DEBUG, INFO, WARNING, ERROR, CRITICAL). Using {fallback}.")
+        return fallback
+    return level
+
+def get_logger():
+    """
+    Create the out folder and the timestamped log file on first use, and return the logger.
+    Records are handed to a queue and written by a background listener thread, so logging never
+    waits on the disk in the crawl and download threads.
+    """
+    global logger, log_filename, _listener
+    if logger is None:
+        with _configure_lock:
+            if logger is None:
+                import atexit
+                import logging
+                import queue
+                from logging.handlers import QueueListener, RotatingFileHandler
+
+                # Create the out folder if it doesn't exist
+                if not os.path.exists('out'):
+                    os.makedirs('out')
+
+                # Create the filename with the current epoch timestamp and specify the path to the out folder
+                log_filename = os.path.join('out', f"scratch-{int(time.time())}.log")
+
+                file_handler = RotatingFileHandler(log_filename, maxBytes=MAX_LOG_BYTES, backupCount=LOG_BACKUPS, delay=True)
+                file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+                log_queue = queue.SimpleQueue()
+                _listener = QueueListener(log_queue, file_handler)
+                _listener.start()
+                # Stopping the listener writes out whatever is still queued
+                atexit.register(_listener.stop)
 
-# # Configure logging to console
-# if debug_mode:
-#     logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-# else:
-#     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+                new_logger = logging.getLogger(__name__)
+                new_logger.addHandler(deferred_queue_handler()(log_queue))
+                new_logger.setLevel(default_level())
+                new_logger.propagate = False
+                logger = new_logger
+    return logger
 
+def set_level(level):
+    """Change the level at runtime, as a name ('DEBUG', 'WARNING'...) or a logging level number."""
+    get_logger().setLevel(level.upper() if isinstance(level, str) else level)
 
-# Configure logging to file
-if debug_mode:
-    logging.basicConfig(filename=log_filename, level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-else:
-    logging.basicConfig(filename=log_filename, level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    
+def set_rotation(max_bytes=MAX_LOG_BYTES, backups=LOG_BACKUPS):
+    """Change the size the log file rolls over at and how many old files are kept."""
+    get_logger()
+    for handler in _listener.handlers:
+        handler.maxBytes = max_bytes
+        handler.backupCount = backups
 
-# Create a logger
-logger = logging.getLogger(__name__)
+def flush():
+    """Wait until every queued record is written, e.g. before reading the log file."""
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener.start()
 
-# Define wrapper functions for logging
-def debug(msg):
-    logger.debug(msg)
+# Define wrapper functions for logging, arguments are %-formatted only if the level is enabled:
+# log.debug("Headers: %s", response.headers) costs nothing when debug logs are off
+def debug(msg, *args):
+    get_logger().debug(msg, *args)
 
-def info(msg):
-    logger.info(msg)
+def info(msg, *args):
+    get_logger().info(msg, *args)
 
-def warning(msg):
-    logger.warning(msg)
+def warning(msg, *args):
+    get_logger().warning(msg, *args)
 
-def error(msg):
-    logger.error(msg)
+def error(msg, *args):
+    get_logger().error(msg, *args)
 
-def critical(msg):
-    logger.critical(msg)
+def critical(msg, *args):
+    get_logger().critical(msg, *args)
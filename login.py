@@ -3,10 +3,11 @@ from bs4 import BeautifulSoup
 import base64
 import json
 from datetime import datetime
-import pytz
 import sys
 import argparse
-from cred_store import store_credentials, fetch_credentials
+import getpass
+import cred_store
+from cred_store import store_credentials
 import itchylog as log
 
 def get_csrf_token(session, url):
@@ -61,61 +62,100 @@ def perform_login(session, url, username, password, csrf_token, offset_minutes):
     response.raise_for_status()
     return response
 
-def main(username, password):
+def log_in(username, password):
+    """Log in to itch.io and store the session cookies as credentials. Returns True on success."""
     login_url = "https://itch.io/login"
     session = requests.Session()
 
     try:
         csrf_token = get_csrf_token(session, login_url)
-        log.debug(f"CSRF Token: {csrf_token}")
+        log.debug("CSRF Token: %s", csrf_token)
 
         nonce_id, timestamp, hash_code, padding = decode_csrf_token(csrf_token)
         timestamp_readable = datetime.utcfromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
-        log.debug(f"Segments:\nNonce/ID: {nonce_id}\nTimestamp: {timestamp} ({timestamp_readable})\nHashCode: {hash_code}\nPadding: {padding}")
+        log.debug("Segments:\nNonce/ID: %s\nTimestamp: %s (%s)\nHashCode: %s\nPadding: %s", nonce_id, timestamp, timestamp_readable, hash_code, padding)
 
         offset_minutes = get_timezone_offset()
-        log.debug(f"Timezone Offset: {offset_minutes}")
+        log.debug("Timezone Offset: %s", offset_minutes)
 
         response = perform_login(session, login_url, username, password, csrf_token, offset_minutes)
 
         if "dashboard" in response.text:
             log.info("Login successful!")
             handle_successful_login(session, response)
+            return True
         else:
-            log.error(f"Login failed. Status code: {response.status_code}")
+            log.error("Login failed. Status code: %s", response.status_code)
             log.error(response.text)
+            return False
     except requests.exceptions.RequestException as e:
-        log.critical(f"An error occurred: {e}")
+        log.critical("An error occurred: %s", e)
+        return False
+
+def check_session():
+    """
+    Ask itch.io whether the stored cookies are still logged in, with a single request that isn't
+    followed: the dashboard answers 200 to a logged in user and redirects to the login page otherwise.
+    """
+    import itchhttp
+    try:
+        response = itchhttp.get("https://itch.io/dashboard", allow_redirects=False)
+    except requests.exceptions.RequestException as e:
+        log.warning("Could not check the session: %s", e)
+        return False
+    response.close()
+    return response.status_code == 200
+
+def ensure_logged_in(username=None, password=None, force=False, margin=cred_store.REFRESH_MARGIN_SECONDS):
+    """
+    Reuse the stored session while it is valid, and only log in again when it is missing, expired or
+    expiring within `margin` seconds (or with `force`). Returns True once a valid session is stored.
+    """
+    status = 'forced' if force else cred_store.session_status(margin)
+    if status == 'unknown':
+        # Credentials stored without an expiry are checked against itch.io instead
+        status = 'valid' if check_session() else 'expired'
+    if status == 'valid':
+        log.info("Reusing the stored itch.io session")
+        return True
+
+    log.info("Stored session %s, logging in", status)
+    if not username:
+        username = input("itch.io username: ")
+    if not password:
+        password = getpass.getpass("itch.io password: ")
+    return log_in(username, password)
+
+def main(username, password, force=False):
+    if not ensure_logged_in(username, password, force):
         sys.exit(1)
 
 def handle_successful_login(session, response):
-    """Handle tasks following a successful login, such as storing and fetching credentials."""
-    cookies = session.cookies.get_dict()
-    log.debug(f"Cookies from session: {cookies}")
-
-    expires_str = [s.split('=')[1] for s in response.headers.get('Set-Cookie', '').split(';') if 'Expires' in s][0]
-    expires_gmt = datetime.strptime(expires_str, "%a, %d %b %Y %H:%M:%S GMT")
-    local_zone = datetime.now().astimezone().tzinfo
-    expires_local = pytz.timezone('GMT').localize(expires_gmt).astimezone(local_zone)
-
-    log.info(f"Cookie Tokens Expire At (Local Time): {expires_local.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-    store_credentials(cookies)
-
-    fetched_headers = fetch_credentials()
-    log.debug(f"Fetched Credentials: {fetched_headers}")
-    validate_stored_credentials(fetched_headers)
+    """Store the whole cookie jar with the session expiry, then check what was stored."""
+    log.debug("Cookies from session: %s", session.cookies.get_dict())
+
+    entries = cred_store.cookie_entries(session.cookies)
+    expires = cred_store.session_expiry(entries)
+    if expires:
+        expires_local = datetime.fromtimestamp(expires).astimezone()
+        log.info("Cookie Tokens Expire At (Local Time): %s", expires_local.strftime('%Y-%m-%d %H:%M:%S %Z'))
+    else:
+        log.warning("The login cookies have no expiry, the session will be checked against itch.io when reused")
+    store_credentials(session.cookies, expires)
+    validate_stored_credentials()
 
-def validate_stored_credentials(headers):
+def validate_stored_credentials():
     """Validate the integrity of stored credentials."""
-    if headers.get('Cookie') and 'itchio_token=' in headers['Cookie'] and 'itchio=' in headers['Cookie']:
+    if cred_store.session_status(margin=0) in ('valid', 'unknown'):
         log.info("Credentials stored and fetched correctly.")
     else:
         log.error("Credentials were not stored/fetched correctly.")
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Login to Itch.io and store credentials securely.")
-    parser.add_argument('--username', required=True, help='Your Itch.io username.')
-    parser.add_argument('--password', required=True, help='Your Itch.io password.')
+    parser = argparse.ArgumentParser(description="Login to Itch.io and store credentials securely, a valid stored session is reused.")
+    parser.add_argument('--username', help='Your Itch.io username, asked for if a login is needed.')
+    parser.add_argument('--password', help='Your Itch.io password, asked for if a login is needed.')
+    parser.add_argument('--force', action='store_true', help='Log in again even if the stored session is still valid.')
 
     args = parser.parse_args()
-    main(args.username, args.password)
+    main(args.username, args.password, args.force)
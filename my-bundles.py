@@ -1,19 +1,20 @@
-import requests
+import argparse
+import asyncio
 from bs4 import BeautifulSoup
-from cred_store import fetch_credentials
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 import itchdb  # Import the itchdb module
-from game_page_info import fetch_additional_game_info 
+import itchhttp
+from game_page_info import parse_number, fetch_additional_game_info, fetch_additional_game_info_if_modified, clear_game_info_memo, game_info_fetched
 import itchylog as log 
 
-headers = fetch_credentials()
-
-def fetch_html(url, headers):
-    response = requests.get(url, headers=headers)
+def fetch_html(url, headers=None):
+    response = itchhttp.get_cached(url, headers=headers)
     if response.status_code == 200:
         response.encoding = 'utf-8'  # Explicitly setting encoding to 'utf-8'
         return BeautifulSoup(response.text, 'html.parser')
     else:
-        log.error(f"Failed to retrieve the page {url}. Status code: {response.status_code}")
+        log.error("Failed to retrieve the page %s. Status code: %s", url, response.status_code)
         return None
 
 def extract_bundles(soup):
@@ -37,89 +38,105 @@ def get_total_pages(soup):
         return int(total_pages)
     return 0
 
-def extract_game_info(soup):
-    games = {}
+def parse_game_row(game):
+    """Parse a bundle page `.game_row` into a partial game record and the URL of its game page."""
+    title = game.select_one('.game_title a').text.strip()
+    dev_name = game.select_one('.game_author a').text.strip()
+    dl_page = game.select_one('.game_title a')['href']  # Extracting game link
+    img_url = game.select_one('.game_thumb').get('data-background_image', 'No image available')
+
+    file_count = parse_number(game.select_one('.file_count').text, int, 0) if game.select_one('.file_count') else 0
+    description = game.select_one('.game_short_text').text.strip() if game.select_one('.game_short_text') else 'No description'
+
+    platforms = []
+    # Check for operating system availability indicators
+    for span in game.select('.meta_row span'):
+        if 'title' in span.attrs:
+            platform = span['title'].replace('Available for ', '')
+            platforms.append(platform)
+
+    # Robust check for "Play in browser" option
+    button_row = game.select_one('.button_row')
+    if button_row:
+        play_in_browser = any(link for link in button_row.select('a') if 'play' in link.text.lower() and 'browser' in link.text.lower())
+        if play_in_browser:
+            platforms.append('Browser')
+
+    # Extracting download URL
+    download_btn = game.select_one('a.game_download_btn')
+    # Default values
+    game_key = download_url = 'UNCLAIMED'
+    home_page = None
+    
+    if download_btn:
+        download_url = download_btn['href']
+        if 'download' in download_url:
+            home_page, game_key = download_url.split('/download/')
+    else:
+        form_btn = game.select_one('form button[name="action"][value="claim"]')
+        download_url = 'UNCLAIMED' if form_btn else 'No download URL'
+
+    # Additional game info is fetched from the game page
+    game_page_url = home_page if home_page else dl_page
+
+    # Ensure dl_page is 'UNCLAIMED' if game_key is 'UNCLAIMED', then update homepage
+    if game_key == 'UNCLAIMED':
+        home_page = dl_page
+        dl_page = 'UNCLAIMED'      
+
+    partial_game = {
+        'Title': title,
+        'Developer': dev_name,
+        'ImageURL': img_url,
+        'HomePage': home_page if home_page else dl_page,
+        'Key': game_key,
+        'DLPage': dl_page,
+        'FileCount': file_count,
+        'Platforms': ', '.join(platforms),
+        'Description': description,
+        'Download': download_url
+    }
+    return partial_game, game_page_url
+
+def merge_game_info(partial_game, additional_game_info):
+    """Complete a partial game record with the fields from its game page info panel."""
+    game = dict(partial_game)
+    game.update({
+        'Stars': additional_game_info.get('Stars'),
+        'RatingCount': additional_game_info.get('RatingCount'),
+        'Author': additional_game_info.get('Author', ''),
+        'Genre': additional_game_info.get('Genre', ''),
+        'AverageSession': additional_game_info.get('AverageSession', ''),
+        'Languages': additional_game_info.get('Languages', ''),
+        'Updated': additional_game_info.get('Updated'),
+        'Published': additional_game_info.get('Published'),
+        'Status': additional_game_info.get('Status', ''),
+        'Inputs': additional_game_info.get('Inputs', ''),
+        'Accessibility': additional_game_info.get('Accessibility', ''),
+        'Tags': additional_game_info.get('Tags', ''),
+        'ReleaseDate': additional_game_info.get('ReleaseDate'),  # Added ReleaseDate field
+        'Other': ', '.join(additional_game_info.get('Other', [])) if isinstance(additional_game_info.get('Other', []), list) else additional_game_info.get('Other', '')
+    })
+    return game
+
+def extract_partial_games(soup):
+    """Parse every `.game_row` on a bundle page, keyed by title like extract_game_info."""
+    partial_games = {}
     game_rows = soup.select('.game_row')
     print(f"{len(game_rows)} games in current batch...")
-    
+
     for game in game_rows:
-        title = game.select_one('.game_title a').text.strip()
-        dev_name = game.select_one('.game_author a').text.strip()
-        dl_page = game.select_one('.game_title a')['href']  # Extracting game link
-        img_url = game.select_one('.game_thumb').get('data-background_image', 'No image available')
-
-        file_count = game.select_one('.file_count').text.split()[0] if game.select_one('.file_count') else 'No files'
-        description = game.select_one('.game_short_text').text.strip() if game.select_one('.game_short_text') else 'No description'
-
-        platforms = []
-        # Check for operating system availability indicators
-        for span in game.select('.meta_row span'):
-            if 'title' in span.attrs:
-                platform = span['title'].replace('Available for ', '')
-                platforms.append(platform)
-
-        # Robust check for "Play in browser" option
-        button_row = game.select_one('.button_row')
-        if button_row:
-            play_in_browser = any(link for link in button_row.select('a') if 'play' in link.text.lower() and 'browser' in link.text.lower())
-            if play_in_browser:
-                platforms.append('Browser')
-
-        # Extracting download URL
-        download_btn = game.select_one('a.game_download_btn')
-        # Default values
-        game_key = download_url = 'UNCLAIMED'
-        home_page = None
-        
-        if download_btn:
-            download_url = download_btn['href']
-            if 'download' in download_url:
-                home_page, game_key = download_url.split('/download/')
-        else:
-            form_btn = game.select_one('form button[name="action"][value="claim"]')
-            download_url = 'UNCLAIMED' if form_btn else 'No download URL'
+        partial_game, game_page_url = parse_game_row(game)
+        partial_games[partial_game['Title']] = (partial_game, game_page_url)
+    return partial_games
 
+def extract_game_info(soup):
+    games = {}
+    for title, (partial_game, game_page_url) in extract_partial_games(soup).items():
         # Fetch additional game info from game page
-        additional_game_info = fetch_additional_game_info(home_page if home_page else dl_page)
-
-        # Ensure dl_page is 'UNCLAIMED' if game_key is 'UNCLAIMED', then update homepage
-        if game_key == 'UNCLAIMED':
-            home_page = dl_page
-            dl_page = 'UNCLAIMED'      
-
+        additional_game_info = fetch_additional_game_info(game_page_url)
         print(f"\nMapping: {title}")
-        # print(f"\n--------  MAPPINGS --------")
-        # print(f"\ndownload_url: {download_url}")
-        # print(f"\ndl_page: {dl_page}")
-        # print(f"\ngame_key: {game_key}")
-        # print(f"\nhome_page: {home_page}")
-        # print(f"\n------------------------------")
-        games[title] = {
-            'Title': title,
-            'Developer': dev_name,
-            'ImageURL': img_url,
-            'HomePage': home_page if home_page else dl_page,
-            'Key': game_key,
-            'DLPage': dl_page,
-            'FileCount': file_count,
-            'Platforms': ', '.join(platforms),
-            'Description': description,
-            'Download': download_url,
-            'Stars': additional_game_info.get('Stars', ''),
-            'RatingCount': additional_game_info.get('RatingCount', ''),
-            'Author': additional_game_info.get('Author', ''),
-            'Genre': additional_game_info.get('Genre', ''),
-            'AverageSession': additional_game_info.get('AverageSession', ''),
-            'Languages': additional_game_info.get('Languages', ''),
-            'Updated': additional_game_info.get('Updated', ''),
-            'Published': additional_game_info.get('Published', ''),
-            'Status': additional_game_info.get('Status', ''),
-            'Inputs': additional_game_info.get('Inputs', ''),
-            'Accessibility': additional_game_info.get('Accessibility', ''),
-            'Tags': additional_game_info.get('Tags', ''),
-            'ReleaseDate': additional_game_info.get('ReleaseDate', ''),  # Added ReleaseDate field
-            'Other': ', '.join(additional_game_info.get('Other', [])) if isinstance(additional_game_info.get('Other', []), list) else additional_game_info.get('Other', '')
-        }
+        games[title] = merge_game_info(partial_game, additional_game_info)
 
     return games
 
@@ -127,8 +144,313 @@ def find_next_page(soup):
     next_page_link = soup.select_one('.next_page')
     return next_page_link['href'] if next_page_link else None
 
-def main():
+def write_game(writer, bundle, partial_game, game_page_url, additional_game_info):
+    """Queue a finished game with its checkpoint, a game whose page could not be fetched is checkpointed as failed."""
+    game = merge_game_info(partial_game, additional_game_info)
+    writer.put(game, bundle)  # Queue game data for the database writer
+    writer.put_checkpoint('game', game_page_url, bundle, 'done' if game_info_fetched(game_page_url) else 'failed')
+    return game
+
+def fetch_game_info_or_empty(game_page_url):
+    """
+    fetch_additional_game_info that logs an exception (e.g. a DNS failure on a developer subdomain) instead of
+    raising it, the game is then written with an empty info panel and checkpointed as failed like an unfetched page.
+    """
+    try:
+        return fetch_additional_game_info(game_page_url)
+    except Exception as exc:
+        log.error("Game page %s generated an exception: %s", game_page_url, exc)
+        return {}
+
+def checkpoint_page(writer, bundle, page_url, soup, partial_games):
+    """Checkpoint a parsed bundle page with its games, and return the URL of the bundle's next page."""
+    next_page_path = find_next_page(soup)
+    next_page_url = f"{bundle['url']}{next_page_path}" if next_page_path else None
+    writer.put_checkpoint('page', page_url, bundle, 'done', next_page_url,
+                          [(game_page_url, partial_game) for partial_game, game_page_url in partial_games.values()])
+    return next_page_url
+
+def finish_interrupted_games(writer, workers=8):
+    """
+    Fetch the game pages an interrupted crawl left pending or failed and write their games.
+    A game already stored with an empty info panel is updated in place.
+    """
+    unfinished_games = itchdb.get_unfinished_games()
+    if not unfinished_games:
+        return 0
+    log.info("Finishing %s games left pending or failed by the last crawl", len(unfinished_games))
+    known_games = itchdb.get_known_games()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        game_infos = executor.map(fetch_game_info_or_empty, [game_page_url for game_page_url, _, _ in unfinished_games])
+        for (game_page_url, bundle, partial_game), additional_game_info in zip(unfinished_games, game_infos):
+            write_game(writer, bundle, partial_game, game_page_url, additional_game_info)
+            known_game = known_games.get(partial_game['HomePage'])
+            if known_game and additional_game_info:
+                writer.put_update(known_game[0], merge_game_info({}, additional_game_info))
+    return len(unfinished_games)
+
+def crawl_bundles(bundles, writer, crawled_pages=None):
+    """Crawl all bundles one page and one game at a time, skipping the pages in `crawled_pages`."""
+    crawled_pages = crawled_pages or {}
+    total_games = 0
+
+    # Fetch games from each bundle
+    for bundle in bundles:
+        log.info("Fetching games from bundle: %s", bundle['name'])
+        current_page_url = bundle['url']
+        bundle_games_count = 0
+
+        while current_page_url:
+            if (current_page_url, bundle['url']) in crawled_pages:
+                log.info("Already crawled: %s", current_page_url)
+                current_page_url = crawled_pages[(current_page_url, bundle['url'])]
+                continue
+            log.info("Fetching data from: %s", current_page_url)
+            soup = fetch_html(current_page_url)
+            if soup:
+                partial_games = extract_partial_games(soup)
+                next_page_url = checkpoint_page(writer, bundle, current_page_url, soup, partial_games)
+                for title, (partial_game, game_page_url) in partial_games.items():
+                    # Fetch additional game info from game page
+                    additional_game_info = fetch_game_info_or_empty(game_page_url)
+                    print(f"\nMapping: {title}")
+                    bundle_games_count += 1
+                    total_games += 1
+                    log.info("Inserting[%d]: '%s' intoDATAABASSe!!", total_games, title)
+                    write_game(writer, bundle, partial_game, game_page_url, additional_game_info)
+                current_page_url = next_page_url
+            else:
+                log.error("Failed to fetch the page.")
+                writer.put_checkpoint('page', current_page_url, bundle, 'failed')
+                break
+
+
+        print("---------------------------------------------------------------")
+        print(f"Total games in bundle '{bundle['name']}': {bundle_games_count}")
+        print("---------------------------------------------------------------")
+
+    return total_games
+
+def sync_bundles(bundles, writer, refresh=False, workers=8):
+    """
+    Incremental sync: walk bundles newest-first and stop once a bundle page reaches games
+    already in the database, inserting only the new ones. With `refresh`, known games are
+    revalidated and updated in place when their game page 'Updated' value changed.
+    """
+    known_games = itchdb.get_known_games()
+    known_memberships = itchdb.get_known_memberships()
+    total_games = 0
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for bundle in bundles:
+            log.info("Syncing games from bundle: %s", bundle['name'])
+            current_page_url = bundle['url']
+            bundle_games_count = 0
+            reached_known_games = False
+
+            while current_page_url and not reached_known_games:
+                log.info("Fetching data from: %s", current_page_url)
+                soup = fetch_html(current_page_url)
+                if not soup:
+                    log.error("Failed to fetch the page.")
+                    break
+                new_games = []
+                for title, (partial_game, game_page_url) in extract_partial_games(soup).items():
+                    if (partial_game['HomePage'], bundle['url']) in known_memberships:
+                        reached_known_games = True
+                    elif partial_game['HomePage'] in known_games:
+                        # Already stored from another bundle, only the membership is new
+                        bundle_games_count += 1
+                        writer.put(merge_game_info(partial_game, {}), bundle)
+                    else:
+                        new_games.append((title, partial_game, game_page_url))
+
+                game_infos = executor.map(fetch_game_info_or_empty, [game_page_url for _, _, game_page_url in new_games])
+                for (title, partial_game, _), additional_game_info in zip(new_games, game_infos):
+                    game = merge_game_info(partial_game, additional_game_info)
+                    total_games += 1
+                    bundle_games_count += 1
+                    log.info("Inserting[%d]: '%s' intoDATAABASSe!!", total_games, title)
+                    writer.put(game, bundle)
+                    known_games[game['HomePage']] = (None, game['Updated'])
+
+                next_page_path = find_next_page(soup)
+                current_page_url = f"{bundle['url']}{next_page_path}" if next_page_path else None
+
+            log.info("New games in bundle '%s': %s", bundle['name'], bundle_games_count)
+            # Bundles are listed newest first, a bundle without new games means the rest are synced too
+            if bundle_games_count == 0:
+                log.info("Reached a bundle without new games, older bundles are already synced.")
+                break
+
+        if refresh:
+            refresh_known_games(known_games, writer, executor)
+
+    return total_games
+
+def refresh_known_games(known_games, writer, executor):
+    """Update games whose game page changed (no 304 from the cache) and whose 'Updated' value differs."""
+    games = [(home_page, game_id, updated) for home_page, (game_id, updated) in known_games.items() if game_id is not None]
+    game_infos = executor.map(fetch_additional_game_info_if_modified, [home_page for home_page, _, _ in games])
+    refreshed = 0
+    for (home_page, game_id, updated), game_info in zip(games, game_infos):
+        if game_info is None or game_info.get('Updated') == updated:
+            continue
+        log.info("Game page %s was updated (%s -> %s)", home_page, updated, game_info.get('Updated'))
+        writer.put_update(game_id, merge_game_info({}, game_info))
+        refreshed += 1
+    log.info("Refreshed %s of %s known games", refreshed, len(games))
+    return refreshed
+
+class HostLimiter:
+    """Per-host cap on the number of requests in flight during an asyncio crawl."""
+
+    def __init__(self, per_host):
+        self.per_host = per_host
+        self.semaphores = {}
+
+    def for_url(self, url):
+        host = urlparse(url).netloc
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.per_host)
+        return self.semaphores[host]
+
+class PipelineMetrics:
+    """Queue depths and item counts of the crawl pipeline stages."""
+
+    def __init__(self, queues):
+        self.queues = queues
+        self.max_depth = {name: 0 for name in queues}
+        self.processed = {name: 0 for name in queues}
+
+    def sample(self):
+        depths = {name: queue.qsize() for name, queue in self.queues.items()}
+        for name, depth in depths.items():
+            self.max_depth[name] = max(self.max_depth[name], depth)
+        return depths
+
+    def report(self):
+        for name in self.queues:
+            log.info("Stage '%s': processed %s, max queue depth %s", name, self.processed[name], self.max_depth[name])
+
+async def crawl_bundles_async(bundles, writer, per_host=4, page_workers=4, detail_workers=16, sink_workers=1, queue_size=256, metrics_interval=5, crawled_pages=None, errors=None):
+    """
+    Crawl all bundles as a three stage pipeline:
+    page workers parse bundle pages into partial game records, detail workers add the
+    game page info panel fields, and sink workers hand finished rows to the database writer.
+    Each stage has its own worker count, and at most `per_host` requests are in flight per host.
+    Pages in `crawled_pages` are skipped, and the exceptions page workers run into are added to `errors`.
+    """
+    crawled_pages = crawled_pages or {}
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=page_workers + detail_workers)
+    if per_host > itchhttp.POOL_MAXSIZE:
+        itchhttp.configure_pools(pool_maxsize=per_host)
+    limiter = HostLimiter(per_host)
+    bundle_queue = asyncio.Queue()
+    detail_queue = asyncio.Queue(maxsize=queue_size)
+    sink_queue = asyncio.Queue(maxsize=queue_size)
+    metrics = PipelineMetrics({'pages': bundle_queue, 'details': detail_queue, 'sink': sink_queue})
+    bundle_games_count = {bundle['name']: 0 for bundle in bundles}
+    total_games = 0
+
+    async def fetch(func, url):
+        async with limiter.for_url(url):
+            return await loop.run_in_executor(executor, func, url)
+
+    async def page_worker():
+        while True:
+            bundle = await bundle_queue.get()
+            current_page_url = bundle['url']
+            try:
+                log.info("Fetching games from bundle: %s", bundle['name'])
+                # Pages of a bundle are chained by their next link
+                while current_page_url:
+                    if (current_page_url, bundle['url']) in crawled_pages:
+                        log.info("Already crawled: %s", current_page_url)
+                        current_page_url = crawled_pages[(current_page_url, bundle['url'])]
+                        continue
+                    log.info("Fetching data from: %s", current_page_url)
+                    soup = await fetch(fetch_html, current_page_url)
+                    if not soup:
+                        log.error("Failed to fetch the page.")
+                        writer.put_checkpoint('page', current_page_url, bundle, 'failed')
+                        break
+                    partial_games = extract_partial_games(soup)
+                    next_page_url = checkpoint_page(writer, bundle, current_page_url, soup, partial_games)
+                    for title, (partial_game, game_page_url) in partial_games.items():
+                        await detail_queue.put((bundle, title, partial_game, game_page_url))
+                    current_page_url = next_page_url
+            except Exception as exc:
+                log.error("Bundle %s generated an exception on %s: %s", bundle['name'], current_page_url, exc)
+                # The page is retried by the next run, like a page that could not be fetched
+                writer.put_checkpoint('page', current_page_url, bundle, 'failed')
+                if errors is not None:
+                    errors.append(exc)
+            finally:
+                metrics.processed['pages'] += 1
+                bundle_queue.task_done()
+
+    async def detail_worker():
+        while True:
+            bundle, title, partial_game, game_page_url = await detail_queue.get()
+            try:
+                additional_game_info = await fetch(fetch_additional_game_info, game_page_url)
+                print(f"\nMapping: {title}")
+                await sink_queue.put((bundle, title, partial_game, game_page_url, additional_game_info))
+            except Exception as exc:
+                log.error("Game %s generated an exception: %s", title, exc)
+                # Counted as an attempt, so a game page that keeps raising ends up skipped
+                writer.put_checkpoint('game', game_page_url, bundle, 'failed')
+            finally:
+                metrics.processed['details'] += 1
+                detail_queue.task_done()
+
+    async def sink_worker():
+        nonlocal total_games
+        while True:
+            bundle, title, partial_game, game_page_url, additional_game_info = await sink_queue.get()
+            try:
+                total_games += 1
+                bundle_games_count[bundle['name']] += 1
+                log.info("Inserting[%d]: '%s' intoDATAABASSe!!", total_games, title)
+                write_game(writer, bundle, partial_game, game_page_url, additional_game_info)
+            finally:
+                metrics.processed['sink'] += 1
+                sink_queue.task_done()
+
+    async def monitor():
+        while True:
+            await asyncio.sleep(metrics_interval)
+            depths = metrics.sample()
+            log.info("Queue depths: %s", depths)
+
+    for bundle in bundles:
+        bundle_queue.put_nowait(bundle)
+
+    workers = [asyncio.create_task(page_worker()) for _ in range(page_workers)]
+    workers += [asyncio.create_task(detail_worker()) for _ in range(detail_workers)]
+    workers += [asyncio.create_task(sink_worker()) for _ in range(sink_workers)]
+    workers.append(asyncio.create_task(monitor()))
+    try:
+        # Each stage is drained only once everything upstream of it is done
+        for queue in (bundle_queue, detail_queue, sink_queue):
+            await queue.join()
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        executor.shutdown(wait=True)
+
+    for name, count in bundle_games_count.items():
+        log.info("Total games in bundle '%s': %s", name, count)
+    metrics.report()
+    return total_games
+
+def main(use_async=False, per_host=4, page_workers=4, detail_workers=16, sink_workers=1, sync=False, refresh=False):
     log.info("Starting main process...")
+    # Every game page is fetched at most once per crawl
+    clear_game_info_memo()
     # Ensure the database and table are created if they don't exist
     if not itchdb.db_file_exists():
         log.info("Scratching up a database...")
@@ -136,64 +458,81 @@ def main():
     elif not itchdb.table_exists():
         log.info("Game table not found, creating db...")
         itchdb.create_db()
+    else:
+        itchdb.upgrade_db()
 
     # Counting the number of rows in the Game table
     row_count = itchdb.count_rows()
-    log.info(f"Total number of rows in the Game table: {row_count}")
+    log.info("Total number of rows in the Game table: %s", row_count)
     
-    # Exit the main function if the row count is more than 0
-    if row_count > 0:
+    # Exit the main function if the last crawl finished, unless syncing the existing database
+    if row_count > 0 and not sync and itchdb.crawl_complete():
         log.info("Trying a test query for a title...")
         game = itchdb.get_game_by_title('A Short Hike')
-        log.info(f"Game retrieved: {game}")
-        log.info(f"DB Already exists and has {row_count} rows (>0 rows).")
+        log.info("Game retrieved: %s", game)
+        log.info("DB Already exists and has %s rows (>0 rows).", row_count)
         return
     else:
         log.info("Creating the database and table...")
         itchdb.create_db()
+    if row_count > 0 and not sync:
+        print(f"Resuming the interrupted crawl, {row_count} games are already in the database.")
+        log.info("Resuming the interrupted crawl from its checkpoints: %s", itchdb.get_crawl_status())
     
     bundles_page_url = 'https://itch.io/my-purchases/bundles'
-    bundles_soup = fetch_html(bundles_page_url, headers)
+    bundles_soup = fetch_html(bundles_page_url)
 
     if bundles_soup:
         bundles = extract_bundles(bundles_soup)
-        log.info(f"Found {len(bundles)} bundles:")
+        log.info("Found %s bundles:", len(bundles))
         for bundle in bundles:
-            log.info(f"Name: {bundle['name']}, URL: {bundle['url']}, Time: {bundle['time']}")
-
-        total_games = 0
+            log.info("Name: %s, URL: %s, Time: %s", bundle['name'], bundle['url'], bundle['time'])
 
-        # Fetch games from each bundle
-        for bundle in bundles:
-            log.info(f"Fetching games from bundle: {bundle['name']}")
-            current_page_url = bundle['url']
-            bundle_games_count = 0
-
-            while current_page_url:
-                log.info(f"Fetching data from: {current_page_url}")
-                soup = fetch_html(current_page_url, headers)
-                if soup:
-                    games = extract_game_info(soup)
-                    bundle_games_count += len(games)
-                    total_games += len(games)
-                    for title, game in games.items():
-                        log.info(f"Inserting[{total_games}]: '{title}' intoDATAABASSe!!")
-                        itchdb.insert_game(game)  # Insert game data into the database
-                    next_page_path = find_next_page(soup)
-                    current_page_url = f"{bundle['url']}{next_page_path}" if next_page_path else None
+        # Scrapers only queue rows, the writer owns the database connection
+        with itchdb.GameWriter() as writer:
+            if sync:
+                log.info("Syncing new games into the %s games already in the database", row_count)
+                total_games = sync_bundles(bundles, writer, refresh, detail_workers)
+            else:
+                # Pages and games checkpointed by an interrupted crawl are not fetched again
+                crawled_pages = itchdb.get_crawled_pages()
+                crawl_errors = []
+                total_games = finish_interrupted_games(writer, detail_workers)
+                if use_async:
+                    log.info("Crawling asynchronously with %d requests per host, %d page, %d detail and %d sink workers",
+                             per_host, page_workers, detail_workers, sink_workers)
+                    total_games += asyncio.run(crawl_bundles_async(bundles, writer, per_host, page_workers, detail_workers, sink_workers,
+                                                                   crawled_pages=crawled_pages, errors=crawl_errors))
                 else:
-                    log.error("Failed to fetch the page.")
-                    break
-
+                    total_games += crawl_bundles(bundles, writer, crawled_pages)
 
-            print("---------------------------------------------------------------")
-            print(f"Total games in bundle '{bundle['name']}': {bundle_games_count}")
-            print("---------------------------------------------------------------")
+        if not sync:
+            crawl_status = itchdb.get_crawl_status()
+            failed = {kind: count for (kind, status), count in crawl_status.items() if status not in ('done', 'skipped')}
+            skipped = itchdb.get_skipped_crawl_items()
+            if skipped:
+                log.warning("Gave up on %s items after %s attempts: %s", len(skipped), itchdb.MAX_CRAWL_ATTEMPTS, skipped)
+                print(f"Gave up on {len(skipped)} pages or games after {itchdb.MAX_CRAWL_ATTEMPTS} failed attempts (retry them with --retry-skipped):")
+                for kind, url, bundle_name, _ in skipped:
+                    print(f"  {kind} {url} (bundle '{bundle_name}')")
+            if writer.failed or writer.error is not None:
+                # Lost rows may include checkpoints, only a crawl that checks them again can complete
+                log.warning("Crawl incomplete, the database writer lost %d rows (%s)", writer.failed, writer.error)
+                print(f"{writer.failed} games or checkpoints could not be written to the database, run the crawl again to retry them.")
+            elif failed:
+                log.warning("Crawl incomplete, unfinished items: %s. Run it again to retry them.", failed)
+                print(f"Some pages could not be fetched ({failed}), run the crawl again to retry only those.")
+            elif crawl_errors:
+                # A page that raised may have left nothing behind to retry, so the crawl is never taken as complete then
+                log.warning("Crawl incomplete, %s bundle page errors: %s", len(crawl_errors), crawl_errors)
+                print(f"{len(crawl_errors)} bundle pages failed with an error, run the crawl again to retry them.")
+            else:
+                itchdb.mark_crawl_complete()
 
         print("---------------------------------------------------------------")
         print("---------------------------------------------------------------")
-        log.info(f"Total games processed from all bundles: {total_games}")
-        log.info(f"Total games in the database: {itchdb.count_rows()}")
+        log.info("Total games processed from all bundles: %s", total_games)
+        log.info("Total games in the database: %s", itchdb.count_rows())
         print("---------------------------------------------------------------")
         print("---------------------------------------------------------------")
 
@@ -201,4 +540,23 @@ def main():
         log.error("Failed to fetch the bundles page.")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Scrape your itch.io bundles into the game database.")
+    parser.add_argument('--async', dest='use_async', action='store_true', help="Fetch bundle pages and game pages concurrently.")
+    parser.add_argument('--per-host', type=int, default=4, help="Maximum requests in flight per host in async mode.")
+    parser.add_argument('--page-workers', type=int, default=4, help="Bundle page workers in async mode.")
+    parser.add_argument('--detail-workers', type=int, default=16, help="Game page workers in async mode.")
+    parser.add_argument('--sink-workers', type=int, default=1, help="Database insert workers in async mode.")
+    parser.add_argument('--sync', action='store_true', help="Only add games bought since the last crawl to the existing database.")
+    parser.add_argument('--refresh', action='store_true', help="With --sync, also update known games whose game page was updated.")
+    parser.add_argument('--retry-skipped', action='store_true', help="Retry the pages and games an earlier crawl gave up on.")
+    parser.add_argument('--rate', type=float, default=itchhttp.RATE, help="Requests per second to itch.io to start at, raised while responses are healthy and halved when throttled.")
+    parser.add_argument('--max-rate', type=float, default=itchhttp.MAX_RATE, help="Requests per second to itch.io never to exceed.")
+    parser.add_argument('--log-level', help="Level of the log written to out/ (DEBUG, INFO, WARNING...), DEBUG by default.")
+    args = parser.parse_args()
+    if args.log_level:
+        log.set_level(args.log_level)
+    if args.retry_skipped and itchdb.db_file_exists():
+        itchdb.upgrade_db()
+        print(f"Retrying {itchdb.retry_skipped_crawl_items()} skipped pages and games.")
+    itchhttp.configure_rate(args.rate, max_rate=args.max_rate)
+    main(args.use_async, args.per_host, args.page_workers, args.detail_workers, args.sink_workers, args.sync, args.refresh)
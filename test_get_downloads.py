@@ -0,0 +1,139 @@
+import os
+import re
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import urllib3
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import get_downloads
+
+UPLOAD = os.urandom(1024 * 1024 + 123)
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """
+    Stands in for itch.io and its CDN: POST /file/<id> hands out a signed URL, GET /blob serves the upload
+    with Range support unless the server turns it off, and can cut one response short to simulate a drop.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.dumps({'url': f"http://127.0.0.1:{self.server.server_port}/blob"}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        requested = self.headers.get('Range')
+        start, end = 0, len(UPLOAD) - 1
+        if requested and server.ranges:
+            first, last = re.match(r'bytes=(\d+)-(\d*)', requested).groups()
+            start, end = int(first), int(last) if last else len(UPLOAD) - 1
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{end}/{len(UPLOAD)}")
+        else:
+            self.send_response(200)
+        if server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        body = UPLOAD[start:end + 1]
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        with server.lock:
+            server.requests.append(requested)
+            drop = server.drop_after is not None and requested != 'bytes=0-0' and len(body) > server.drop_after
+            if drop:
+                drop_after, server.drop_after = server.drop_after, None
+        if drop:
+            self.wfile.write(body[:drop_after])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        self.wfile.write(body)
+
+class SegmentedDownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+        self.server.ranges = True
+        self.server.drop_after = None
+        self.server.requests = []
+        self.server.lock = threading.Lock()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/game/file/1?source=game_download&key=k"
+        self.dest = tempfile.mkdtemp()
+        # Small segments so a 1 MiB upload splits
+        self.defaults = get_downloads.MIN_SEGMENT_SIZE, get_downloads.RETRY_DELAY
+        get_downloads.MIN_SEGMENT_SIZE, get_downloads.RETRY_DELAY = 64 * 1024, 0
+
+    def tearDown(self):
+        get_downloads.MIN_SEGMENT_SIZE, get_downloads.RETRY_DELAY = self.defaults
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dest)
+
+    def download(self, retries=3):
+        # A small buffer, so a dropped response keeps most of what it sent
+        return get_downloads.follow_redirect_and_download(self.url, 'upload.bin', self.dest, retries=retries, segments=4,
+                                                          buffer_size=16 * 1024)
+
+    def downloaded(self, path):
+        with open(path, 'rb') as file:
+            return file.read()
+
+    def test_split_download(self):
+        path = self.download()
+        self.assertEqual(self.downloaded(path), UPLOAD)
+        segment_requests = [requested for requested in self.server.requests if requested != 'bytes=0-0']
+        self.assertEqual(len(segment_requests), 4)
+        self.assertFalse(os.path.exists(path + get_downloads.PART_SUFFIX))
+        self.assertFalse(os.path.exists(path + get_downloads.PART_SUFFIX + '.json'))
+
+    def test_interrupted_segment_resumes(self):
+        self.server.drop_after = 100 * 1024
+        self.assertIsNone(self.download(retries=1))
+        part = os.path.join(self.dest, 'upload.bin' + get_downloads.PART_SUFFIX)
+        received, total, segments = get_downloads.read_part_state(part)
+        self.assertEqual(total, len(UPLOAD))
+        self.assertLess(received, total)
+
+        self.server.requests.clear()
+        path = self.download()
+        self.assertEqual(self.downloaded(path), UPLOAD)
+        # Only the dropped segment is fetched again, from where it was cut off
+        resumed = [requested for requested in self.server.requests if requested]
+        self.assertEqual(len(resumed), 1)
+        start, end = map(int, re.match(r'bytes=(\d+)-(\d+)', resumed[0]).groups())
+        self.assertNotIn(start, [segment[0] for segment in segments])
+        self.assertEqual(end - start + 1, total - received)
+
+    def test_no_range_fallback(self):
+        self.server.ranges = False
+        path = self.download()
+        self.assertEqual(self.downloaded(path), UPLOAD)
+        self.assertEqual([requested for requested in self.server.requests if requested != 'bytes=0-0'], [None])
+
+    def test_unencoded_body_read_directly(self):
+        # The body goes straight from http.client into the buffer, urllib3's copying readinto is never used
+        with mock.patch.object(urllib3.response.HTTPResponse, 'readinto', side_effect=AssertionError('urllib3 readinto used')):
+            path = self.download()
+        self.assertEqual(self.downloaded(path), UPLOAD)
+
+class PreallocateTest(unittest.TestCase):
+    def test_unsupported_fallocate_falls_back_to_truncate(self):
+        def unsupported(fd, offset, length):
+            raise OSError(95, 'Operation not supported')
+
+        with tempfile.TemporaryFile() as file, mock.patch.object(get_downloads.os, 'posix_fallocate', unsupported, create=True):
+            get_downloads.preallocate(file, 4096)
+            self.assertEqual(os.fstat(file.fileno()).st_size, 4096)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,7 +7,9 @@ def print_usage():
     print("Setup Utility for your Game Database")
     print("---------------------------------------")
     print("\nUsage for _setup.py:")
-    print("  py _setup.py --username USERNAME --password 'PASSWORD'")
+    print("  py _setup.py [--username USERNAME --password 'PASSWORD']")
+    print("  The stored itch.io session is reused until it is about to expire, only then are the username")
+    print("  and password needed (they are asked for when not given).")
     
     
     print("---------------------------------------")
@@ -21,20 +23,36 @@ def print_usage():
     print("  -h, --help       Show this help message and exit")
     print("  --title TITLE    Query game by title")
     print("  --genre GENRE    Query games by genre containing the specified substring")
+    print("  --search TERMS   Full-text search over titles, developers, descriptions, tags and genres")
+    print("  --limit N        Maximum number of search results (default 20)")
+    print("  --with FACET:NAME     Query games with a tag, genre, platform, input or language (repeatable)")
+    print("  --without FACET:NAME  Leave out games with a tag, genre, platform, input or language (repeatable)")
     print("  --sql SQL        Execute a custom SQL query")
+    print("  --format FORMAT  Write --sql results as csv, tsv or jsonl")
+    print("  --out FILE       Write --sql results to a file")
+    print("  --offset N       Skip the first N results of --sql (page with --limit)")
     print("  --rows           Count the number of rows in the Game table")
     
     print("\nSample SQL Usage Examples:")
-    print("  python _query.py --sql \"SELECT Title, Developer FROM Game WHERE Stars > '4.5'\"")
-    print("  python _query.py --sql \"SELECT Title, RatingCount FROM Game WHERE RatingCount > '100'\"")
+    print("  python _query.py --sql \"SELECT Title, Developer FROM Game WHERE Stars > 4.5\"")
+    print("  python _query.py --sql \"SELECT Title, RatingCount FROM Game WHERE RatingCount > 100\"")
     print("  python _query.py --sql \"SELECT * FROM Game WHERE Tags LIKE '%multiplayer%'\"")
-    print("\n> Note: 'Stars' and 'RatingCount' are stored as strings, so comparisons should be done cautiously.")
-    
-    print("\nDO NOT WORK, THIS IS ON THE TODO LIST, WORK IN PROGRESS!!! =================")
     print("  python _query.py --sql \"SELECT * FROM Game WHERE date(Published) > date('2018-01-01')\"")
     print("  python _query.py --sql \"SELECT * FROM Game WHERE Published > '2020'\"")
-    print("  python _query.py --sql \"SELECT * FROM Game WHERE Genre LIKE '%Sci-Fi%'\"")
-    print("DO NOT WORK=======================================")
+    print("\n> Note: 'Stars' is a number, 'RatingCount' and 'FileCount' are integers, and 'Updated', 'Published'")
+    print("> and 'ReleaseDate' are ISO-8601 dates (YYYY-MM-DD HH:MM:SS), so they compare and sort as you'd expect.")
+    
+
+    print("\nSample Search Usage Examples:")
+    print("  python _query.py --search \"space roguelike\"")
+    print("  python _query.py --search \"pixel*\" --limit 50")
+    print("  python _query.py --search \"Title: hike\"")
+
+    print("\nSample Filter Usage Examples:")
+    print("  python _query.py --with genre:Action --with platform:Linux --without tag:Horror")
+    print("  python _query.py --sql \"SELECT g.Title FROM Game g JOIN GameTag gt ON gt.GameId = g.id JOIN Tag t ON t.id = gt.TagId WHERE t.Name = 'multiplayer'\"")
+    print("\n> Tags, genres, platforms, inputs and languages are also linked through the Tag/GameTag, Genre/GameGenre,")
+    print("> Platform/GamePlatform, Input/GameInput and Language/GameLanguage tables.")
     
     print("\nTable Columns for Manual SQL Usage:")
     print("  id, Title, Developer, ImageURL, HomePage, Key, DLPage, FileCount, Platforms, Description,")
@@ -43,6 +61,9 @@ def print_usage():
     
     print("\nTo output to a text file:")
     print("  python _query.py --sql \"SELECT * FROM Game WHERE Genre LIKE '%RPG%'\" > RPG.txt")
+    print("\nTo export to CSV, TSV or JSON Lines with column headers (streamed, so any size works):")
+    print("  python _query.py --sql \"SELECT * FROM Game\" --format csv --out library.csv")
+    print("  python _query.py --sql \"SELECT Title, Stars FROM Game ORDER BY Stars DESC\" --format jsonl --limit 100 --offset 200")
     print("\n")
     
     print("---------------------------------------")
@@ -55,8 +76,14 @@ def print_usage():
     print("  -h, --help      Show this help message and exit")
     print("  --title TITLE   Specify the title of the game to query")
     print("  --dir DIR       Specify the directory for downloads")
+    print("  --batch         Queue every game matching --with/--without/--genre/--search/--sql and download them")
+    print("  --priority N    Higher priorities are downloaded first (with --batch)")
+    print("  --workers N     Number of games downloaded at once (with --batch)")
     print("\nSample Scratch by Title Usage Example:")
     print("  python _scratch.py --dir '/Users/aeonitis/temp'")
+    print("\nSample Batch Download Example (all Linux roguelikes, resumable with itchqueue.py --run):")
+    print("  python _scratch.py --dir '/Users/aeonitis/temp' --batch --with platform:Linux --with tag:Roguelike")
+    print("  python itchqueue.py --status")
     print("=======================================\n")
     
 if __name__ == "__main__":